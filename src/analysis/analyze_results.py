@@ -1,13 +1,12 @@
 import os
 import logging
-from typing import Set
+from typing import TYPE_CHECKING, Set
 import re
 
-import pandas as pd
-
 from util import setup
 
-CONFIG = setup("../config/config.yaml")
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 def is_valid_string(s):
@@ -33,6 +32,8 @@ class ParquetReader(object):
         logging.info(f"ParquetReader will filter content for valid strings: {filter_valid_content}.")
 
     def __iter__(self):
+        import pandas as pd  # lazy import
+
         cnt = 0
         for root, dirs, files in os.walk(self._dir_parquets):
             for file in files:
@@ -48,7 +49,7 @@ class ParquetReader(object):
         logging.info(f"ParquetReader iterated through {cnt} parquet files in total.")
 
 
-def get_baseurls(df: pd.DataFrame) -> Set:
+def get_baseurls(df: "pd.DataFrame") -> Set:
     return set(list(df['base_url'].drop_duplicates()))
 
 
@@ -76,9 +77,12 @@ class LogReader(object):
 
 
 if __name__ == "__main__":
+    import pandas as pd
 
     logging.basicConfig(level=logging.INFO)
 
+    CONFIG = setup("../config/config.yaml")
+
     # Input URLs
     with open(f"{CONFIG.input.input_dir}/{CONFIG.input.input_files.urls}", 'r', encoding='utf-8') as file_in:
         urls = [line.rstrip() for line in file_in]
@@ -0,0 +1,92 @@
+import os
+import argparse
+import logging
+import time
+from typing import Dict, List
+from urllib.parse import urlsplit
+
+from crawl import URLCanonicalizer
+from parse import ILinkExtractor, LxmlLinkExtractor, SoupLinkExtractor
+
+
+class PageCorpus(object):
+    def __init__(
+            self,
+            dir_pages: str):
+        """
+        Corpus of saved pages, every .html file in the folder is a page.
+        The first line of a file may hold its URL as an html comment: <!-- url: https://... -->
+        """
+        self._dir_pages = dir_pages
+        logging.info(f"PageCorpus will search for html files in: {dir_pages}.")
+
+    def __iter__(self):
+        for root, dirs, files in os.walk(self._dir_pages):
+            for file in sorted(files):
+                if file.endswith(('.html', '.htm')):
+                    with open(os.path.join(root, file), 'r', encoding='utf-8', errors='replace') as file_in:
+                        html = file_in.read()
+                    url = f"https://{os.path.splitext(file)[0]}/"
+                    if html.startswith("<!-- url: "):
+                        url = html[len("<!-- url: "):html.index(" -->")]
+                    yield url, html
+
+
+def benchmark(extractor: ILinkExtractor, pages: List, repeat: int) -> Dict:
+    """Time extraction of all pages, returns the best of repeat runs and the links found"""
+    timings = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        links = [extractor.extract(url=url, html=html) for url, html in pages]
+        timings.append(time.perf_counter() - time_start)
+    return {"seconds": min(timings), "links": links}
+
+
+def benchmark_sites(extractor: ILinkExtractor, pages: List, repeat: int, known: bool) -> Dict:
+    """
+    Time extraction and canonicalization of all pages like the crawler does, pages of the same site share
+    the set of canonical URLs. With known=True hrefs already seen on the site are skipped before resolving.
+    """
+    canonicalizer = URLCanonicalizer()
+    timings = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        sites = dict()
+        for url, html in pages:
+            hrefs, urls = sites.setdefault(urlsplit(url).netloc, (set(), set()))
+            urls.update(canonicalizer(link) for link in extractor.extract(url=url, html=html, known=hrefs if known else None))
+        timings.append(time.perf_counter() - time_start)
+    return {"seconds": min(timings), "urls": sum(len(urls) for _, urls in sites.values())}
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO)
+
+    argparser = argparse.ArgumentParser(description="Compare link extraction by lxml and BeautifulSoup on saved pages")
+    argparser.add_argument("--corpus", required=True, help="folder with saved .html pages")
+    argparser.add_argument("--repeat", type=int, default=3)
+    args = argparser.parse_args()
+
+    pages = list(PageCorpus(dir_pages=args.corpus))
+    size = sum(len(html) for _, html in pages)
+    logging.info(f"Benchmarking on {len(pages)} pages, {size / 1e6:.1f} MB of html.")
+
+    results = {}
+    for extractor in [SoupLinkExtractor(), LxmlLinkExtractor()]:
+        name = type(extractor).__name__
+        results[name] = benchmark(extractor=extractor, pages=pages, repeat=args.repeat)
+        logging.info(f"{name}: {results[name]['seconds']:.3f} seconds, {1000 * results[name]['seconds'] / max(len(pages), 1):.2f} ms per page.")
+
+    soup, lxml = results["SoupLinkExtractor"], results["LxmlLinkExtractor"]
+    logging.info(f"Speedup of lxml over bs4: {soup['seconds'] / max(lxml['seconds'], 1e-9):.1f}x.")
+    differences = [url for (url, _), a, b in zip(pages, soup["links"], lxml["links"]) if set(a) != set(b)]
+    logging.info(f"Pages where the extracted links differ: {len(differences)} of {len(pages)}.")
+    for url in differences[:10]:
+        logging.info(f"Links differ for: {url}")
+
+    for known in [False, True]:
+        name = "with known hrefs" if known else "without known hrefs"
+        results[name] = benchmark_sites(extractor=LxmlLinkExtractor(), pages=pages, repeat=args.repeat, known=known)
+        logging.info(f"Extract and canonicalize {name}: {results[name]['seconds']:.3f} seconds, {results[name]['urls']} unique urls.")
+    logging.info(f"Speedup of skipping known hrefs: {results['without known hrefs']['seconds'] / max(results['with known hrefs']['seconds'], 1e-9):.1f}x.")
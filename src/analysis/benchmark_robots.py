@@ -0,0 +1,94 @@
+import os
+import argparse
+import logging
+import time
+from typing import Dict, Iterator, List, Tuple
+from urllib.robotparser import RobotFileParser
+
+from fetch import RobotsRules
+
+
+def read_corpus(dir_robots: str) -> List[Tuple[str, str]]:
+    """(domain, text) of every .txt file in the folder, the file name is the domain, e.g. cbs.nl.txt"""
+    corpus = []
+    for file in sorted(os.listdir(dir_robots)):
+        if file.endswith(".txt"):
+            with open(os.path.join(dir_robots, file), 'r', encoding='utf-8', errors='replace') as file_in:
+                corpus.append((file[:-len(".txt")], file_in.read()))
+    return corpus
+
+
+def rule_paths(text: str) -> Iterator[str]:
+    """Path patterns of all Allow and Disallow lines"""
+    for line in text.splitlines():
+        field, _, value = line.split("#", 1)[0].partition(":")
+        value = value.strip()
+        if field.strip().lower() in ("allow", "disallow") and value:
+            yield value
+
+
+def paths_from_rules(text: str) -> List[str]:
+    """Paths to check when no urls are given: every rule path with some variations, and a few common pages"""
+    paths = ["/", "/vacatures", "/werken-bij", "/nl/over-ons", "/search?q=vacature", "/page/2?sort=date"]
+    for pattern in rule_paths(text):
+        if pattern.startswith("/"):
+            path = pattern.rstrip("$").replace("*", "x")
+            paths += [path, f"{path}/index.html", f"{path}?id=12"]
+    return paths
+
+
+def benchmark(name: str, corpus: List[Tuple[str, str]], urls: Dict[str, List[str]], user_agent: str, repeat: int) -> Dict:
+    """Time parsing and checking all urls, returns the best of repeat runs and the decisions"""
+    timings = []
+    for _ in range(repeat):
+        time_start = time.perf_counter()
+        decisions = []
+        for domain, text in corpus:
+            if name == "stdlib":
+                parser = RobotFileParser()
+                parser.parse(text.splitlines())
+                decisions.append([parser.can_fetch(user_agent, url) for url in urls[domain]])
+            else:
+                rules = RobotsRules.parse(text=text, user_agent=user_agent)
+                decisions.append([rules.allowed(url) for url in urls[domain]])
+        timings.append(time.perf_counter() - time_start)
+    return {"seconds": min(timings), "decisions": decisions}
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.INFO)
+
+    argparser = argparse.ArgumentParser(description="Compare the compiled robots matcher with urllib.robotparser on saved robots.txt files")
+    argparser.add_argument("--corpus", required=True, help="folder with saved robots.txt files, named after their domain, e.g. cbs.nl.txt")
+    argparser.add_argument("--urls", help="file with urls to check, one per line, by default paths are made from the rules")
+    argparser.add_argument("--useragent", default="Web-FOSS-NL-webfocusedscrape/0.1")
+    argparser.add_argument("--repeat", type=int, default=3)
+    args = argparser.parse_args()
+
+    corpus = read_corpus(dir_robots=args.corpus)
+    urls = {domain: [f"https://{domain}{path}" for path in paths_from_rules(text)] for domain, text in corpus}
+    if args.urls:
+        with open(args.urls, 'r', encoding='utf-8') as file_in:
+            given = [line.strip() for line in file_in if line.strip()]
+        urls = {domain: [url for url in given if url.split("/")[2] == domain] for domain, _ in corpus}
+    checks = sum(len(domain_urls) for domain_urls in urls.values())
+    logging.info(f"Benchmarking on {len(corpus)} robots files, {checks} urls.")
+
+    results = {}
+    for name in ["stdlib", "compiled"]:
+        results[name] = benchmark(name=name, corpus=corpus, urls=urls, user_agent=args.useragent, repeat=args.repeat)
+        logging.info(f"{name}: {results[name]['seconds']:.3f} seconds, {1e6 * results[name]['seconds'] / max(checks, 1):.2f} us per url.")
+
+    stdlib, compiled = results["stdlib"], results["compiled"]
+    logging.info(f"Speedup of compiled over stdlib: {stdlib['seconds'] / max(compiled['seconds'], 1e-9):.1f}x.")
+
+    # the standard library has no wildcards and takes the first matching rule instead of the longest
+    differences = [
+        (url, a, b)
+        for (domain, text), decisions_a, decisions_b in zip(corpus, stdlib["decisions"], compiled["decisions"])
+        for url, a, b in zip(urls[domain], decisions_a, decisions_b) if a != b]
+    with_wildcards = sum(1 for _, text in corpus if any("*" in path or path.endswith("$") for path in rule_paths(text)))
+    logging.info(f"Decisions that differ: {len(differences)} of {checks}, {with_wildcards} of {len(corpus)} files use wildcards.")
+    for url, a, b in differences[:10]:
+        logging.info(f"stdlib {'allows' if a else 'disallows'}, compiled {'allows' if b else 'disallows'}: {url}")
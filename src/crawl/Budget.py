@@ -0,0 +1,95 @@
+from typing import Dict, Optional
+import logging
+
+
+class CrawlBudget(object):
+    """
+    Adaptive budget for the number of page visits per site
+    Without adaptation every site gets max_visits. With adaptation, a site that has found too few
+    targets per visit after min_visits is stopped early, unless targeted URLs are still waiting in its frontier.
+    If sharing is enabled, visits saved this way are given to productive sites that reach max_visits.
+    One budget is kept for the whole run, so the pool of saved visits carries over between sites.
+    """
+    def __init__(
+            self,
+            max_visits: int,
+            adaptive: bool = False,
+            min_visits: int = 50,
+            min_yield: float = 0.01,
+            share: bool = False,
+            productive_yield: float = 0.1,
+            max_extra_visits: int = 200):
+        """
+        :param max_visits: Visits per site without adaptation
+        :param adaptive: False to only stop on max_visits
+        :param min_visits: Visits before a site can be stopped for low yield
+        :param min_yield: Targets per visit below which a site is stopped
+        :param share: True if saved visits are given to productive sites
+        :param productive_yield: Targets per visit for a site to receive saved visits
+        :param max_extra_visits: Maximum number of saved visits given to a single site
+        """
+        logging.info(f"Initializing CrawlBudget with max_visits={max_visits}, adaptive={adaptive}, share={share}")
+        self.max_visits = max_visits
+        self.adaptive = adaptive
+        self.min_visits = min_visits
+        self.min_yield = min_yield
+        self.share = share
+        self.productive_yield = productive_yield
+        self.max_extra_visits = max_extra_visits
+        logging.debug(f"Sites stop after {min_visits} visits with fewer than {min_yield} targets per visit")
+
+        self.pool = 0  # visits saved on low yield sites, available for productive sites
+        self.start_site()
+
+    def start_site(self):
+        """Reset the visit limit for the next site"""
+        self.visit_limit = self.max_visits
+        self.extra_visits = 0
+
+    def check(self, visits: int, targets: int, min_frontier_depth: Optional[float] = None) -> Optional[str]:
+        """
+        Returns the reason to stop crawling the current site, or None to continue
+        :param visits: Pages visited on the site so far
+        :param targets: Targeted URLs found on the site so far
+        :param min_frontier_depth: Lowest depth in the frontier, 0 means targeted URLs are still waiting
+        """
+        site_yield = targets / visits if visits > 0 else 0.
+
+        if self.adaptive and visits >= self.min_visits and site_yield < self.min_yield:
+            if min_frontier_depth != 0:
+                logging.info(f"Low yield of {site_yield:.3f} targets per visit after {visits} visits")
+                return "low_yield"
+
+        if visits >= self.visit_limit:
+            if self._extend(visits=visits, site_yield=site_yield):
+                return None
+            return "max_visits"
+        return None
+
+    def _extend(self, visits: int, site_yield: float) -> bool:
+        """Give saved visits to a productive site that reached its limit"""
+        if not (self.adaptive and self.share) or self.pool <= 0 or site_yield < self.productive_yield:
+            return False
+
+        extension = min(self.pool, self.max_extra_visits - self.extra_visits, self.min_visits)
+        if extension <= 0:
+            return False
+
+        self.pool -= extension
+        self.extra_visits += extension
+        self.visit_limit += extension
+        logging.info(f"Productive site ({site_yield:.3f} targets per visit) gets {extension} extra visits, {self.pool} left in pool")
+        return True
+
+    def end_site(self, visits: int, stop_reason: str):
+        """Put visits that were not used by a low yield site in the pool"""
+        if self.share and stop_reason == "low_yield":
+            saved = max(self.max_visits - visits, 0)
+            self.pool += saved
+            logging.debug(f"Saved {saved} visits on low yield site, {self.pool} in pool")
+
+    def get_stats(self) -> Dict:
+        return {
+            "visit_limit": self.visit_limit,
+            "extra_visits": self.extra_visits,
+            "budget_pool": self.pool}
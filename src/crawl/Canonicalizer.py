@@ -0,0 +1,94 @@
+from typing import List, Optional
+import logging
+import re
+import fnmatch
+from urllib.parse import urlsplit, urlunsplit
+
+
+class URLCanonicalizer(object):
+    """
+    Rewrites URLs to a canonical form, so that variants of the same page are fetched only once
+    The host is always lowercased and trailing slashes are always removed from the path.
+    Other rules can be switched on or off.
+    The query string is not re-encoded: parameters are only dropped or reordered.
+    """
+    def __init__(
+            self,
+            force_https: bool = False,
+            strip_www: bool = False,
+            drop_fragment: bool = True,
+            drop_default_port: bool = True,
+            sort_query: bool = True,
+            drop_params: Optional[List[str]] = None):
+        """
+        :param force_https: Rewrite http to https, breaks sites that only serve http
+        :param strip_www: Remove a leading 'www.' from the host, only safe if sites serve both
+        :param drop_fragment: Remove the part after '#', which is never sent to the server
+        :param drop_default_port: Remove ':80' and ':443'
+        :param sort_query: Order query parameters by name
+        :param drop_params: Query parameter names to remove, '*' wildcards allowed, e.g. 'utm_*'
+        """
+        logging.info("Initializing URLCanonicalizer")
+        self.force_https = force_https
+        self.strip_www = strip_www
+        self.drop_fragment = drop_fragment
+        self.drop_default_port = drop_default_port
+        self.sort_query = sort_query
+
+        drop_params = ["utm_*", "fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "_ga", "_gl"] if drop_params is None else list(drop_params)
+        self._drop_params = re.compile("|".join(fnmatch.translate(param) for param in drop_params)) if drop_params else None
+        logging.debug(f"Query parameters that will be removed from URLs: {', '.join(drop_params)}")
+
+    def canonicalize(self, url: str) -> str:
+        """Return the canonical form of url, or url itself if it can not be parsed"""
+        try:
+            parts = urlsplit(url)
+            scheme, netloc, path, query, fragment = parts
+            port = parts.port
+        except ValueError:
+            return url.rstrip('/')
+
+        scheme = scheme.lower()
+        netloc = netloc.lower()
+
+        if self.drop_default_port and port is not None:
+            if (port == 80 and scheme == "http") or (port == 443 and scheme == "https"):
+                netloc = netloc[:netloc.rindex(':')]
+        if self.force_https and scheme == "http":
+            scheme = "https"
+        if self.strip_www and netloc.startswith("www."):
+            netloc = netloc[4:]
+
+        path = path.rstrip('/')
+
+        if query:
+            params = [param for param in query.split('&') if param]
+            if self._drop_params is not None:
+                params = [param for param in params if not self._drop_params.match(param.split('=', 1)[0])]
+            if self.sort_query:
+                params.sort(key=lambda param: param.split('=', 1)[0])
+            query = '&'.join(params)
+
+        if self.drop_fragment:
+            fragment = ''
+
+        return urlunsplit((scheme, netloc, path, query, fragment))
+
+    def __call__(self, url: str) -> str:
+        return self.canonicalize(url)
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    canonicalizer = URLCanonicalizer()
+
+    urls = [
+        "http://WWW.CBS.nl:80/nl-nl/vacatures/",
+        "https://www.cbs.nl/nl-nl/vacatures?utm_source=nieuwsbrief&page=2&fbclid=abc#top",
+        "https://werkenbijhetcbs.nl/vacature-overzicht-express#/?page=1",
+        "https://books.toscrape.com/"
+    ]
+    for url in urls:
+        print(f"{url} -> {canonicalizer(url)}")
@@ -1,17 +1,20 @@
-from typing import List
+from typing import Iterator, List, Optional, Tuple, Union
+from collections import Counter
 import time
 import logging
+import math
 import re
 
-import numpy as np
-from urllib.parse import urlparse, urljoin
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse
+from omegaconf import DictConfig
 
 from .base import BaseCrawler, CrawlResult
+from .Budget import CrawlBudget
+from .Canonicalizer import URLCanonicalizer
+from .Scorer import IFrontierScorer, LinkScorer
+from .Traps import TrapDetector
 from fetch import HTMLFetcher
-from util import setup
-
-CONFIG = setup("../config/config.yaml")
+from parse import ILinkExtractor, LxmlLinkExtractor
 
 
 class HesitantCrawler(BaseCrawler): 
@@ -19,8 +22,12 @@ class HesitantCrawler(BaseCrawler):
             self,
             fetcher: HTMLFetcher,
             target_keywords: List[str],
+            config: DictConfig,
             add_sitemapurls: bool = False,
-            max_depth: int = 1):
+            max_depth: int = 1,
+            link_extractor: Optional[ILinkExtractor] = None,
+            scorer: Optional[IFrontierScorer] = None,
+            traps: Optional[TrapDetector] = None):
         """
         Depth-limited Search Targeted Crawler
         Crawler class for obtaining urls from start_url.
@@ -40,25 +47,51 @@ class HesitantCrawler(BaseCrawler):
 
         :param add_sitemapurls: True if urls from sitemap are added to crawl
         :param target_keywords: List of targeting keywords in regex format
+        :param config: Config object, read once by the caller
         :param max_depth: How many steps further do we look beyond non-targeted results, defaults to 1
+        :param link_extractor: Finds the links on visited pages, defaults to the lxml based extractor
+        :param scorer: Scores links so that promising ones are visited earlier, defaults to a LinkScorer if scoring is enabled in config
+        :param traps: Keeps calendars, filters and other endless URL spaces out of the queue, defaults to a TrapDetector if enabled in config
         """
         logging.info(f"Initializing HesitantCrawler with max_depth={max_depth}")
         self.max_depth = max_depth
         if max_depth < 0:
             logging.debug("Only urls from starting_url (and possibly sitemap if used) can be found, since max_depth<0")
 
-        super(HesitantCrawler, self).__init__(fetcher=fetcher)
+        # All URLs are canonicalized before they are checked, queued or visited
+        canonicalizer = URLCanonicalizer(
+            force_https=config.crawl.canonical.force_https,
+            strip_www=config.crawl.canonical.strip_www,
+            drop_fragment=config.crawl.canonical.drop_fragment,
+            drop_default_port=config.crawl.canonical.drop_default_port,
+            sort_query=config.crawl.canonical.sort_query,
+            drop_params=config.crawl.canonical.drop_params)
+
+        super(HesitantCrawler, self).__init__(
+            fetcher=fetcher,
+            canonicalizer=canonicalizer,
+            url_fingerprints=config.crawl.url_fingerprints)
 
         # crawl delay will be overwritten if robots from given domain provides a value  # TODO: make sure
         self.crawl_delay = 2
         logging.debug(f"Defaul crawl delay is set to {self.crawl_delay}")
 
-        self.max_duration = CONFIG.crawl.max_duration
+        self.max_duration = config.crawl.max_duration
         logging.debug(f"Max duration of crawl set to {self.max_duration} seconds")
 
-        self.max_crawl_visits = CONFIG.crawl.max_visits
+        self.max_crawl_visits = config.crawl.max_visits
         logging.debug(f"Max page visits of crawl set to {self.max_crawl_visits}")
 
+        # Sites with a low yield of targets may be stopped before max visits
+        self.budget = CrawlBudget(
+            max_visits=self.max_crawl_visits,
+            adaptive=config.crawl.budget.adaptive,
+            min_visits=config.crawl.budget.min_visits,
+            min_yield=config.crawl.budget.min_yield,
+            share=config.crawl.budget.share,
+            productive_yield=config.crawl.budget.productive_yield,
+            max_extra_visits=config.crawl.budget.max_extra_visits)
+
         # Targets
         self.target_keywords = target_keywords
         logging.info(f"The targeted crawl will look for given keywords: {', '.join(self.target_keywords)}")
@@ -84,11 +117,45 @@ class HesitantCrawler(BaseCrawler):
         self.add_sitemapurls = add_sitemapurls
         logging.info(f"Will we check URLs from sitemap? Answer: {add_sitemapurls}")
 
+        self.link_extractor = link_extractor or LxmlLinkExtractor()
+
+        # URLs with promising anchor text or URL are visited first
+        self.scorer = scorer
+        if scorer is None and config.crawl.scoring.enabled:
+            self.scorer = LinkScorer(
+                keywords=list(target_keywords) + list(config.crawl.scoring.keywords),
+                negative_keywords=list(config.crawl.scoring.negative_keywords),
+                anchor_weight=config.crawl.scoring.anchor_weight,
+                url_weight=config.crawl.scoring.url_weight,
+                negative_weight=config.crawl.scoring.negative_weight,
+                parent_weight=config.crawl.scoring.parent_weight,
+                yield_weight=config.crawl.scoring.yield_weight)
+        logging.info(f"Frontier is ordered by depth{' minus link score' if self.scorer is not None else ''}")
+
+        # URLs that follow the same template are queued a limited number of times
+        self.traps = traps
+        if traps is None and config.crawl.traps.enabled:
+            self.traps = TrapDetector(
+                max_per_template=config.crawl.traps.max_per_template,
+                max_param_values=config.crawl.traps.max_param_values,
+                max_segment_repeats=config.crawl.traps.max_segment_repeats,
+                max_path_depth=config.crawl.traps.max_path_depth)
+
+    def reset_results(self):
+        super(HesitantCrawler, self).reset_results()
+        self._variants = set()  # URL variants that were collapsed onto an already known canonical URL
+        self._hrefs = set()  # keys of the raw hrefs seen on this site, see LinkResolver.key
+        self._frontier_depths = Counter()  # {depth: URLs in the queue}, so the lowest depth is known without a scan
+        self._fetches_saved = 0
+        self._visits_first_target = None  # visits needed to find the first target, shows how well the frontier is ordered
+        if self.traps is not None:
+            self.traps.reset()
+
     def skip_this_url(self, url: str) -> bool:
         """Function to see if we have already visited url"""
 
-        # prevent duplicate crawl from trailing forward slash in URL
-        url = url.rstrip('/') if url.endswith('/') else url
+        # prevent duplicate crawl from variants of the same URL
+        url = self.canonical(url)
 
         # Do not revisit pages
         if url in self._visited:
@@ -96,24 +163,45 @@ class HesitantCrawler(BaseCrawler):
             return True  # skip
         return False 
 
-    def find_urls(self, url: str, html: str) -> str:
+    def find_urls(self, url: str, html: Union[str, bytes]) -> str:
         """
         Generator that yields a URLs to check for target condition        
         """
+        for canonical_url, _ in self.find_links(url=url, html=html):
+            yield canonical_url
 
-        soup = BeautifulSoup(html, "html.parser")
-
-        # Extract links - will later be checked if they are internal 
-        for link in soup.find_all("a", href=True):
-            href = link["href"]
-            absolute_url = urljoin(url, href)  # TODO: find out if necessary
-            absolute_url = absolute_url.rstrip('/') if absolute_url.endswith('/') else absolute_url
-            # parsed = urlparse(absolute_url)
-
-            # if parsed.netloc == self.domain and absolute_url not in self._istargeted:
-            if absolute_url not in self._istargeted:
-                logging.debug(f"Found a URL to check: {absolute_url}")
-                yield absolute_url      
+    def find_links(self, url: str, html: Union[str, bytes]) -> Iterator[Tuple[str, str]]:
+        """
+        Generator that yields URLs to check for target condition with their anchor text
+        Anchor texts are only collected if there is a scorer
+        """
+        if self.scorer is not None:
+            links = self.link_extractor.extract_anchors(url=url, html=html, known=self._hrefs)
+        else:
+            links = [(link, "") for link in self.link_extractor.extract(url=url, html=html, known=self._hrefs)]
+
+        new_urls = 0
+        for absolute_url, text in links:
+            canonical_url = self.canonical(absolute_url)
+
+            if canonical_url not in self._istargeted:
+                new_urls += 1
+                yield canonical_url, text
+            else:
+                self._count_variant(url=absolute_url, canonical_url=canonical_url)
+        logging.debug(f"Found {new_urls} new URLs to check on {url}")
+
+    def _count_variant(self, url: str, canonical_url: str):
+        """
+        Keep track of URLs that would have been treated as new without canonicalization
+        A fetch is saved if the canonical URL itself is crawled
+        """
+        url = url.rstrip('/')
+        if url == canonical_url or url in self._variants:
+            return
+        self._variants.add(url)
+        if not self._istargeted.is_deadend(canonical_url) and self._istargeted.depth(canonical_url) <= self.max_depth:
+            self._fetches_saved += 1
 
     def find_target(self, parsed: str) -> str:
         """Check if the parsed URL matches the target keywords in subdomain or path"""
@@ -149,10 +237,7 @@ class HesitantCrawler(BaseCrawler):
             return
 
         if any(ext in url for ext in self._unsupported):
-            self._istargeted[url] = {
-                'parent': parent_url,
-                'depth': np.inf,
-                'is_deadend': True}
+            self._istargeted.add(url, parent=parent_url, depth=math.inf, is_deadend=True)
             logging.debug("Unsupported url, setting depth to infinite and deadend=True, will not be added to queue")
             return
 
@@ -166,8 +251,9 @@ class HesitantCrawler(BaseCrawler):
             is_deadend = True  # won't be added to queue if from sitemap tree
         
         if domain != self.start_domain:
-            if domain != self._istargeted[parent_url]['domain']:
-                if self._istargeted[parent_url]['domain'] != self.start_domain:
+            parent_domain = self._istargeted.domain(parent_url)
+            if domain != parent_domain:
+                if parent_domain != self.start_domain:
                     # In this case we have jumped to a third domain, not allowed at all! 
                     logging.debug("Deviated from domain twice, url is not allowed")
                     return
@@ -186,13 +272,9 @@ class HesitantCrawler(BaseCrawler):
         logging.debug(f"Result of check if the URL is targeted: {is_targeted}")
 
         # keep track of how far wway we've walked from targeted site
-        depth = 0 if is_targeted else self._istargeted[parent_url]['depth'] + 1
+        depth = 0 if is_targeted else self._istargeted.depth(parent_url) + 1
         logging.debug(f"Depth = steps away from a targeted URL: {depth}")
-        self._istargeted[url] = {
-            'domain': parsed.netloc,
-            'parent': parent_url,
-            'depth': depth,
-            'is_deadend': is_deadend}
+        self._istargeted.add(url, domain=parsed.netloc, parent=parent_url, depth=depth, is_deadend=is_deadend)
 
         # Add to results if targeted
         if is_targeted:
@@ -202,15 +284,47 @@ class HesitantCrawler(BaseCrawler):
 
         # May anyways be added to queue of URLs to visit for more URLS
         if (depth <= self.max_depth) and (not is_deadend) and (not from_sitemap):
+            if self.traps is not None and not self.traps.allow(url, parsed=parsed):
+                logging.debug(f"Not adding {url} to queue, it looks like a crawler trap")
+                return
             logging.debug(f"Adding the URL to queue vor visiting with depth={depth} at max_depth={self.max_depth}")
-            self._queue.append(url)
+            self._enqueue(url)
+
+    def _enqueue(self, url: str):
+        self._queue.append(url)
+        self._frontier_depths[self._depth(url)] += 1
+
+    def _dequeue(self) -> str:
+        url = self._queue.pop(0)
+        depth = self._depth(url)
+        self._frontier_depths[depth] -= 1
+        if not self._frontier_depths[depth]:
+            del self._frontier_depths[depth]
+        return url
     
     def order_queue(self):
-        """Reorder elements in queue by ascending depth of URL, so that targeted URLs are visited first"""
+        """
+        Reorder elements in queue by ascending depth of URL, so that targeted URLs are visited first
+        With a scorer, the score of a URL counts as steps of depth: a URL scoring 2 is visited
+        together with URLs two steps closer to a target.
+        """
 
         if len(self._queue) > 0:
-            self._queue = sorted(self._queue, key=lambda x: self._istargeted.get(x, {'depth': np.inf})['depth'])
+            self._queue = sorted(self._queue, key=self._priority)
+
+    def _priority(self, url: str) -> float:
+        return self._istargeted.depth(url) - self._istargeted.score(url)
+
+    def _depth(self, url: str) -> float:
+        """Steps away from a targeted URL, infinite if unknown"""
+        return self._istargeted.depth(url)
     
+    def score_links(self, links: List[Tuple[str, str]], parent_url: str, parent_yield: float):
+        """Score all new links of a page in one go"""
+        scores = self.scorer.score(links=links, parent_score=self._istargeted.score(parent_url), parent_yield=parent_yield)
+        for (url, _), score in zip(links, scores):
+            self._istargeted.set_score(url, score)
+
     def crawl(self):
         """
         Main crawling function
@@ -227,18 +341,35 @@ class HesitantCrawler(BaseCrawler):
 
         # The queue will be updated with found urls and then worked through
         # until a maximum number of visits or duration is reached
-        self._queue = [self.start_url]
+        self._queue = []
+        self._frontier_depths.clear()
         start_time = time.time()
         duration = 0
 
         # for reference, put start_url and domain in dictionary
-        self._istargeted[self.start_url] = {'depth': 0, 'domain': domain, 'is_deadend': False}
-        self._istargeted[domain] = {'depth': 0, 'domain': domain, 'is_deadend': False}
+        self._istargeted.add(self.start_url, depth=0, domain=domain, is_deadend=False)
+        self._istargeted.add(domain, depth=0, domain=domain, is_deadend=False)
+        self._enqueue(self.start_url)
     
-        while self._queue and len(self._visited) < self.max_crawl_visits and duration < self.max_duration:
+        self.budget.start_site()
+        stop_reason = "frontier_empty"
+        while self._queue:
+
+            # Stop on duration, or when the budget for this site is used up
+            if duration >= self.max_duration:
+                stop_reason = "max_duration"
+                break
+            # queue is ordered by depth and score, so the lowest depth in the frontier is not always first
+            budget_stop = self.budget.check(
+                visits=len(self._visited),
+                targets=len(self._results),
+                min_frontier_depth=min(self._frontier_depths))
+            if budget_stop is not None:
+                stop_reason = budget_stop
+                break
 
             # Take an element from the queue
-            visiting_url = self._queue.pop(0)  # will start with base url, then whatever will have been added next
+            visiting_url = self._dequeue()  # will start with base url, then whatever will have been added next
 
             # Check if we already visited URL
             logging.debug(f"Check if {visiting_url} can be skipped")
@@ -251,8 +382,15 @@ class HesitantCrawler(BaseCrawler):
             if len(visiting_html) == 0:  # Nothing returned
                 continue
 
-            for found_url in self.find_urls(url=visiting_url, html=visiting_html):
+            links = []
+            targets_before = len(self._results)
+            for found_url, text in self.find_links(url=visiting_url, html=visiting_html):
                 self.process_url(url=found_url, parent_url=visiting_url)
+                links.append((found_url, text))
+            if self.scorer is not None and links:
+                self.score_links(links=links, parent_url=visiting_url, parent_yield=(len(self._results) - targets_before) / len(links))
+            if self._visits_first_target is None and self._results:
+                self._visits_first_target = len(self._visited)
 
             # At the end, measure how long we've been busy so far
             duration = time.time() - start_time
@@ -264,39 +402,62 @@ class HesitantCrawler(BaseCrawler):
 
             # order queue by depth, ascending - so that targeted URLs are crawled before the ones further removed
             self.order_queue()
-        
+        self.budget.end_site(visits=len(self._visited), stop_reason=stop_reason)
+
         # Crawl stopped
-        logging.debug(f"Crawl stopped after {np.around(duration, 0)} seconds, with max duration {self.max_duration} seconds")
-        logging.debug(f"Crawl stopped after {len(self._visited)} page visits, with max {self.max_crawl_visits}")
+        logging.info(f"Crawl of {self.start_url} stopped because of: {stop_reason}")
+        logging.debug(f"Crawl stopped after {round(duration, 0)} seconds, with max duration {self.max_duration} seconds")
+        logging.debug(f"Crawl stopped after {len(self._visited)} page visits, with max {self.budget.visit_limit}")
         logging.debug(f"Crawl stopped with {len(self._queue)} urls still in the queue")
 
         logging.info(f"Crawling from {self.start_url} involved checking {len(self._istargeted)} URLs for meeting the target")
         logging.info(f"Crawling from {self.start_url} resulted in {len(self.get_results())} results")
+        logging.info(f"Canonicalization of {len(self._variants)} URL variants saved {self._fetches_saved} fetches")
         logging.debug(f"Crawling from {self.start_url} results: {self.get_results()}")
-        
+
+        self._stats = {
+            "start_url": self.start_url,
+            "visits": len(self._visited),
+            "targets": len(self._results),
+            "duration": round(duration, 1),
+            "queue_left": len(self._queue),
+            "frontier_depths": dict(self._frontier_depths),
+            "stop_reason": stop_reason,
+            "url_variants": len(self._variants),
+            "fetches_saved": self._fetches_saved,
+            "visits_first_target": self._visits_first_target,
+            **self.budget.get_stats()}
+        if self.traps is not None:
+            self._stats.update(self.traps.get_stats())
+
         if self.add_sitemapurls:
             self.extendcrawl_fromsitemaps(domain=domain)
+            self._stats["targets_with_sitemap"] = len(self._results)
 
     def extendcrawl_fromsitemaps(self, domain: str):
         sitemap_urls = self._fetcher.robotsfetcher.get_sitemap_urls(domain=domain)
         if sitemap_urls:
             logging.info(f"Sitemaps of {self.start_url} linked to {len(sitemap_urls)} URLs to check for meeting the target")
             for found_url in sitemap_urls: 
-                self.process_url(url=found_url, parent_url=domain, from_sitemap=True)
+                self.process_url(url=self.canonical(found_url), parent_url=domain, from_sitemap=True)
             logging.info(f"Sitemaps of {self.start_url} increased the number of results to {len(self.get_results())}")
         logging.info(f"No sitemap URLs found for {self.start_url}")
 
 
 if __name__ == "__main__":
 
+    from util import setup
+
     logging.basicConfig(level=logging.INFO)
 
+    config = setup("../config/config.yaml")
     target_keywords = ["vacature"]
-    fetcher = HTMLFetcher()
+    fetcher = HTMLFetcher(config=config)
 
     crawler = HesitantCrawler(
         fetcher=fetcher,
         target_keywords=target_keywords,
+        config=config,
         max_depth=-1,
         add_sitemapurls=True
     )
@@ -0,0 +1,111 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from typing import List, Tuple
+import logging
+import re
+
+from parse import combinable
+
+
+class IFrontierScorer(ABC):
+    """
+    Interface for frontier scorers, that decide which of the found links are visited first
+    """
+
+    @abstractmethod
+    def score(self, links: List[Tuple[str, str]], parent_score: float = 0., parent_yield: float = 0.) -> List[float]:
+        """
+        Scores of all links found on a single page, higher is visited earlier
+        :param links: (url, anchor text) of the links on the page
+        :param parent_score: Score of the page the links were found on
+        :param parent_yield: Share of the links on the page that were targeted
+        """
+        raise NotImplementedError("Do not call abstract base class.")
+
+
+class LinkScorer(IFrontierScorer):
+    """
+    Scores links on keywords in their anchor text and URL, and on the page they were found on
+    All anchor texts of a page are searched in one pass of a single combined regex, and so are all URLs.
+    Promising keywords (e.g. 'werken bij') add to the score, keywords of pages that rarely lead to
+    targets (e.g. 'privacy') subtract from it. Links found on high scoring or high yield pages inherit
+    part of that. As in KeywordTagger, keywords that can not be combined are searched for separately.
+    """
+    _separators = re.compile(r"[-_/.+%=&?]")  # URL tokens are matched as words, the URL length is kept
+
+    def __init__(
+            self,
+            keywords: List[str],
+            negative_keywords: List[str],
+            anchor_weight: float = 2.,
+            url_weight: float = 1.,
+            negative_weight: float = 1.,
+            parent_weight: float = 0.5,
+            yield_weight: float = 1.):
+        """
+        :param keywords: Regexes of promising anchor texts and URL tokens, matched case insensitive, empty ones are left out
+        :param negative_keywords: Regexes of anchor texts and URL tokens of links that are better visited last
+        :param anchor_weight: Added for a keyword in the anchor text
+        :param url_weight: Added for a keyword in the URL
+        :param negative_weight: Subtracted for a negative keyword in anchor text or URL
+        :param parent_weight: Share of the score of the page that is inherited by its links
+        :param yield_weight: Added times the share of targeted links on the page
+        """
+        logging.info(f"Initializing LinkScorer with {len(keywords)} keywords and {len(negative_keywords)} negative keywords")
+        keywords = [keyword for keyword in keywords if keyword.strip()]
+        negative_keywords = [keyword for keyword in negative_keywords if keyword.strip()]
+        positive = "|".join(f"(?:{keyword})" for keyword in keywords if combinable(keyword)) or "(?!)"
+        negative = "|".join(f"(?:{keyword})" for keyword in negative_keywords if combinable(keyword)) or "(?!)"
+        self._pattern = re.compile(f"(?P<pos>{positive})|(?P<neg>{negative})", re.IGNORECASE)
+        self._separate = (
+            [("pos", re.compile(keyword, re.IGNORECASE)) for keyword in keywords if not combinable(keyword)]
+            + [("neg", re.compile(keyword, re.IGNORECASE)) for keyword in negative_keywords if not combinable(keyword)])
+        self.anchor_weight = anchor_weight
+        self.url_weight = url_weight
+        self.negative_weight = negative_weight
+        self.parent_weight = parent_weight
+        self.yield_weight = yield_weight
+
+    def _hits(self, texts: List[str]) -> Tuple[List[int], List[int]]:
+        """Per text 1 if it contains a keyword and 1 if it contains a negative keyword, from a single regex pass"""
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+        joined = "\n".join(text.replace("\n", " ") for text in texts)
+
+        hits = {"pos": [0] * len(texts), "neg": [0] * len(texts)}
+        for match in self._pattern.finditer(joined):
+            hits[match.lastgroup][bisect_right(starts, match.start()) - 1] = 1
+        for group, pattern in self._separate:
+            for match in pattern.finditer(joined):
+                hits[group][bisect_right(starts, match.start()) - 1] = 1
+        return hits["pos"], hits["neg"]
+
+    def score(self, links: List[Tuple[str, str]], parent_score: float = 0., parent_yield: float = 0.) -> List[float]:
+        if not links:
+            return []
+        anchor_pos, anchor_neg = self._hits([text for _, text in links])
+        # scheme and host are the same for most links on a page, only path and query are searched
+        urls = [url.split("/", 3)[3] if url.count("/") >= 3 else "" for url, _ in links]
+        url_pos, url_neg = self._hits([self._separators.sub(" ", url) for url in urls])
+
+        inherited = self.parent_weight * parent_score + self.yield_weight * parent_yield
+        return [
+            self.anchor_weight * a_pos + self.url_weight * u_pos - self.negative_weight * max(a_neg, u_neg) + inherited
+            for a_pos, u_pos, a_neg, u_neg in zip(anchor_pos, url_pos, anchor_neg, url_neg)]
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    scorer = LinkScorer(keywords=["vacature", "werken bij", "careers?"], negative_keywords=["privacy", "cookie"])
+    links = [
+        ("https://www.cbs.nl/nl-nl/over-ons/werken-bij-het-cbs", "Werken bij het CBS"),
+        ("https://www.cbs.nl/nl-nl/privacy", "Privacy"),
+        ("https://www.cbs.nl/nl-nl/nieuws", "Nieuws"),
+        ("https://www.cbs.nl/en-gb/careers", "")]
+    for (url, text), score in zip(links, scorer.score(links, parent_score=1.)):
+        print(f"{score:5.2f} {url} '{text}'")
@@ -0,0 +1,112 @@
+from collections import Counter, defaultdict
+from typing import Dict, Optional, Union
+from urllib.parse import ParseResult, SplitResult, parse_qsl, urlsplit
+import logging
+import re
+
+
+class TrapDetector(object):
+    """
+    Keeps the crawl out of URL spaces that never end, like calendars, faceted search and session ids in URLs
+    URLs are reduced to a template: numbers and ids in the path become placeholders and the query keeps only
+    its parameter names, e.g. /agenda/2024/05?page=3 becomes /agenda/{n}/{n}?page. A URL is not queued when
+    its template was queued max_per_template times, when one of its query parameters already had
+    max_param_values distinct values on the same path, or when its path repeats segments or is too deep.
+    State is kept per site, call reset() before the next one.
+    """
+    _number = re.compile(r"\d+")
+    _id = re.compile(r"^(?=.*\d)[0-9a-f-]{16,}$|^(?=.*\d)(?=.*[a-z])[0-9a-z]{24,}$", re.IGNORECASE)  # hashes, uuids and session tokens
+
+    def __init__(
+            self,
+            max_per_template: int = 50,
+            max_param_values: int = 20,
+            max_segment_repeats: int = 2,
+            max_path_depth: int = 12,
+            top_templates: int = 10):
+        """
+        :param max_per_template: URLs queued per template, 0 for no limit
+        :param max_param_values: Distinct values of a query parameter queued per path template, 0 for no limit
+        :param max_segment_repeats: Times a path segment may occur in a path, e.g. /a/b/a/b has each twice
+        :param max_path_depth: Segments in a path
+        :param top_templates: Number of throttled templates reported in the stats of a site
+        """
+        logging.info(f"Initializing TrapDetector with {max_per_template} URLs per template and {max_param_values} values per query parameter")
+        self.max_per_template = max_per_template
+        self.max_param_values = max_param_values
+        self.max_segment_repeats = max_segment_repeats
+        self.max_path_depth = max_path_depth
+        self.top_templates = top_templates
+        self.reset()
+
+    def reset(self):
+        self._templates = Counter()  # {template: URLs queued}
+        self._param_values = defaultdict(set)  # {(path template, parameter): hashes of the values queued}
+        self._throttled = Counter()  # {template: URLs not queued}
+        self._reasons = Counter()
+
+    def _segment(self, segment: str) -> str:
+        if self._id.match(segment):
+            return "{id}"
+        return self._number.sub("{n}", segment)
+
+    def template(self, parsed: Union[SplitResult, ParseResult]) -> str:
+        """Path with placeholders for numbers and ids, followed by the names of the query parameters"""
+        path = parsed.path.split(";", 1)[0]  # path parameters like ;jsessionid=... are left out
+        path_template = "/".join(self._segment(segment) for segment in path.split("/"))
+        names = sorted(name for name, _ in parse_qsl(parsed.query, keep_blank_values=True))
+        return f"{path_template}?{'&'.join(names)}" if names else path_template
+
+    def _trap_reason(self, parsed: Union[SplitResult, ParseResult], template: str) -> Optional[str]:
+        segments = [segment for segment in parsed.path.split("/") if segment]
+        if len(segments) > self.max_path_depth:
+            return "path_depth"
+        if segments and Counter(segments).most_common(1)[0][1] > self.max_segment_repeats:
+            return "repeated_segment"
+        if self.max_per_template and self._templates[template] >= self.max_per_template:
+            return "template"
+        if self.max_param_values and parsed.query:
+            path_template = template.split("?", 1)[0]
+            for name, value in parse_qsl(parsed.query, keep_blank_values=True):
+                values = self._param_values[(path_template, name)]
+                if hash(value) not in values and len(values) >= self.max_param_values:
+                    return "param_values"
+        return None
+
+    def allow(self, url: str, parsed: Optional[Union[SplitResult, ParseResult]] = None) -> bool:
+        """True if url may be queued, in that case it is counted against its template and query parameters"""
+        parsed = parsed or urlsplit(url)
+        template = self.template(parsed)
+        reason = self._trap_reason(parsed=parsed, template=template)
+        if reason is not None:
+            if not self._throttled[template]:
+                logging.info(f"Throttling URLs like {url} because of {reason}")
+            self._throttled[template] += 1
+            self._reasons[reason] += 1
+            return False
+
+        self._templates[template] += 1
+        if parsed.query:
+            path_template = template.split("?", 1)[0]
+            for name, value in parse_qsl(parsed.query, keep_blank_values=True):
+                self._param_values[(path_template, name)].add(hash(value))
+        return True
+
+    def get_stats(self) -> Dict:
+        """Throttled URLs of the current site, by reason and for the most throttled templates"""
+        return {
+            "trap_urls_throttled": sum(self._throttled.values()),
+            "trap_reasons": dict(self._reasons),
+            "trap_templates": dict(self._throttled.most_common(self.top_templates))}
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    detector = TrapDetector(max_per_template=5, max_param_values=3)
+    urls = [f"https://www.example.nl/agenda/2025/{month}" for month in range(1, 13)]
+    urls += [f"https://www.example.nl/vacatures?page={page}" for page in range(1, 10)]
+    urls += ["https://www.example.nl/a/b/a/b/a/b", "https://www.example.nl/vacatures/data-scientist"]
+    print([url for url in urls if detector.allow(url)])
+    print(detector.get_stats())
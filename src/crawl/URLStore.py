@@ -0,0 +1,124 @@
+from typing import Optional
+from array import array
+import math
+import sys
+
+
+class URLStateStore(object):
+    """
+    Compact store of the state of all URLs found during a crawl
+    Every URL gets an integer id. Domain, parent, depth, dead end flag and frontier score are kept in parallel arrays
+    indexed by that id, and domains are interned, so no dict or float is allocated per URL.
+    With fingerprints=True, URLs are kept as 64-bit hashes instead of strings: membership and
+    state lookups still work, but URLs can not be recovered from their id.
+    """
+    DEPTH_INF = 0xFFFF  # stored for infinite depth, e.g. unsupported URLs
+    NONE = -1  # stored for unknown domain or parent
+
+    def __init__(self, fingerprints: bool = False):
+        self.fingerprints = fingerprints
+        self._ids = dict()  # {url or fingerprint: id}
+        self._urls = []  # id -> url, only without fingerprints
+        self._domains = []  # domain id -> domain
+        self._domain_ids = dict()  # {domain: domain id}
+        self._domain = array('i')
+        self._parent = array('i')
+        self._depth = array('H')
+        self._deadend = bytearray()
+        self._score = array('f')
+
+    def _key(self, url: str):
+        return hash(url) if self.fingerprints else url
+
+    def __contains__(self, url: str) -> bool:
+        return self._key(url) in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(
+            self,
+            url: str,
+            depth: float = math.inf,
+            domain: Optional[str] = None,
+            parent: Optional[str] = None,
+            is_deadend: bool = False,
+            score: float = 0.) -> int:
+        """Store state of url, overwrites the state if url is already known, returns the id of url"""
+        domain_id = self.NONE
+        if domain is not None:
+            domain_id = self._domain_ids.setdefault(domain, len(self._domains))
+            if domain_id == len(self._domains):
+                self._domains.append(domain)
+        parent_id = self._ids.get(self._key(parent), self.NONE) if parent is not None else self.NONE
+        depth = self.DEPTH_INF if depth == math.inf else min(int(depth), self.DEPTH_INF - 1)
+
+        key = self._key(url)
+        url_id = self._ids.get(key)
+        if url_id is None:
+            url_id = len(self._ids)
+            self._ids[key] = url_id
+            if not self.fingerprints:
+                self._urls.append(url)
+            self._domain.append(domain_id)
+            self._parent.append(parent_id)
+            self._depth.append(depth)
+            self._deadend.append(is_deadend)
+            self._score.append(score)
+        else:
+            self._domain[url_id] = domain_id
+            self._parent[url_id] = parent_id
+            self._depth[url_id] = depth
+            self._deadend[url_id] = is_deadend
+            self._score[url_id] = score
+        return url_id
+
+    def id(self, url: str) -> Optional[int]:
+        return self._ids.get(self._key(url))
+
+    def url(self, url_id: int) -> Optional[str]:
+        """URL of given id, None if it is unknown or only its fingerprint is kept"""
+        if self.fingerprints or not 0 <= url_id < len(self._urls):
+            return None
+        return self._urls[url_id]
+
+    def depth(self, url: str, default: float = math.inf) -> float:
+        """Steps away from a targeted URL"""
+        url_id = self._ids.get(self._key(url))
+        if url_id is None:
+            return default
+        depth = self._depth[url_id]
+        return math.inf if depth == self.DEPTH_INF else depth
+
+    def domain(self, url: str) -> Optional[str]:
+        url_id = self._ids.get(self._key(url))
+        if url_id is None or self._domain[url_id] == self.NONE:
+            return None
+        return self._domains[self._domain[url_id]]
+
+    def parent(self, url: str) -> Optional[str]:
+        url_id = self._ids.get(self._key(url))
+        if url_id is None:
+            return None
+        return self.url(self._parent[url_id])
+
+    def is_deadend(self, url: str) -> bool:
+        url_id = self._ids.get(self._key(url))
+        return url_id is not None and bool(self._deadend[url_id])
+
+    def score(self, url: str, default: float = 0.) -> float:
+        """Frontier score, higher scoring URLs are visited first among URLs at the same depth"""
+        url_id = self._ids.get(self._key(url))
+        return default if url_id is None else self._score[url_id]
+
+    def set_score(self, url: str, score: float):
+        url_id = self._ids.get(self._key(url))
+        if url_id is not None:
+            self._score[url_id] = score
+
+    def nbytes(self) -> int:
+        """Approximate size of the arrays and the id index, not counting the URL strings themselves"""
+        return (
+            sys.getsizeof(self._ids) + sys.getsizeof(self._urls) + sys.getsizeof(self._domains)
+            + self._domain.itemsize * len(self._domain) + self._parent.itemsize * len(self._parent)
+            + self._depth.itemsize * len(self._depth) + len(self._deadend) + self._score.itemsize * len(self._score))
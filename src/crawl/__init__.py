@@ -1,2 +1,6 @@
 from .base import ICrawler, NoCrawler, BaseCrawler, CrawlResult
+from .Canonicalizer import URLCanonicalizer
+from .URLStore import URLStateStore
+from .Scorer import IFrontierScorer, LinkScorer
+from .Traps import TrapDetector
 from .HesitantCrawler import HesitantCrawler
\ No newline at end of file
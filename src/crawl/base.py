@@ -1,9 +1,11 @@
 from abc import ABC, abstractmethod
-from typing import NamedTuple, List
+from typing import NamedTuple, List, Dict, Optional
 import logging
 from urllib.parse import urlparse
 
 from fetch import IFetcher
+from .Canonicalizer import URLCanonicalizer
+from .URLStore import URLStateStore
 
 
 class CrawlResult(NamedTuple):
@@ -31,6 +33,11 @@ class ICrawler(ABC):
         """Return list of crawled URLs"""
         return NotImplementedError()
 
+    @abstractmethod
+    def get_stats(self) -> Dict:
+        """Return statistics of the last crawl"""
+        raise NotImplementedError("Do not call abstract base class.")
+
     @abstractmethod
     def crawl():
         """Crawl candidate URLs"""
@@ -41,36 +48,50 @@ class BaseCrawler(ICrawler):
     """
     Base functionality of all Crawlers
     """
-    def __init__(self, fetcher: IFetcher):
+    def __init__(self, fetcher: IFetcher, canonicalizer: Optional[URLCanonicalizer] = None, url_fingerprints: bool = False):
         super(BaseCrawler, self).__init__(fetcher=fetcher)
         self.start_url = ""
         self.start_domain = ""
         self.crawl_delay = 2
+        self.canonicalizer = canonicalizer
+        self.url_fingerprints = url_fingerprints  # keep found URLs as 64-bit hashes instead of strings
+
+    def canonical(self, url: str) -> str:
+        """Canonical form of url, only trailing slashes are removed if there is no canonicalizer"""
+        if self.canonicalizer is None:
+            return url.rstrip('/')
+        return self.canonicalizer(url)
 
     def reset_results(self):
         logging.debug("Crawler is (re)set with empty results")
         self._results = []  # for output
         self._queue = []  # for next visits
         self._visited = dict()  # to keep track of visited pages
-        self._istargeted = dict()  # will keep track of urls and if they met targeting conditions
+        self._istargeted = URLStateStore(fingerprints=self.url_fingerprints)  # will keep track of urls and if they met targeting conditions
+        self._stats = dict()  # statistics of the crawl, e.g. why it stopped
 
     def reset_with_starturl(self, start_url: str):
         """Reset crawler and set url from which to start the crawl"""
         self.reset_results()
 
         logging.debug(f"Crawler start url given as: {start_url}")
-        if not start_url.startswith('https://') and not start_url.startswith('http://'):
+        if not start_url.lower().startswith(('https://', 'http://')):
             logging.debug("Start URL lacks required http or https prefix")
             start_url = f"https://{start_url}"
             logging.info(f"Prefix 'https://' added to start URL: {start_url}")
-        self.start_url = start_url
+        self.start_url = self.canonical(start_url)
 
-        self.start_domain = urlparse(start_url).netloc
+        # from the canonical url, so that links of the site itself, which are canonicalized too, are on the same domain
+        self.start_domain = urlparse(self.start_url).netloc
 
     def get_results(self) -> List[CrawlResult]:
         """Return list of crawled URLs"""
         return self._results
 
+    def get_stats(self) -> Dict:
+        """Return statistics of the last crawl"""
+        return self._stats
+
     def crawl():
         """Crawl candidate URLs"""
         raise NotImplementedError()
@@ -90,6 +111,7 @@ class NoCrawler(BaseCrawler):
         logging.info("Just adding start-url to the results")
         result = CrawlResult(url=self.start_url, source="NoCrawler")
         self._results.append(result)
+        self._stats = {"start_url": self.start_url, "visits": 0, "targets": 1, "stop_reason": "no_crawl"}
 
 
 if __name__ == "__main__":
@@ -0,0 +1,105 @@
+from typing import Dict, Optional
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+import logging
+import random
+import threading
+import time
+
+
+class CircuitBreaker(object):
+    """
+    Per-domain circuit breaker
+    After max_failures consecutive failures the circuit of a domain opens, and requests to it are
+    refused until reset_after seconds have passed. Then a single trial request is let through:
+    success closes the circuit again, failure keeps it open for another reset_after seconds.
+    """
+    def __init__(self, max_failures: int = 5, reset_after: float = 600):
+        logging.info(f"Initializing CircuitBreaker, domains are skipped after {max_failures} consecutive failures")
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self._lock = threading.Lock()
+        self._failures = dict()  # {domain: consecutive failures}
+        self._opened = dict()  # {domain: time circuit was opened}
+        self.stats = {"opened": 0, "short_circuited": 0}
+
+    def allow(self, domain: str) -> bool:
+        """Returns False if requests to domain should be skipped"""
+        with self._lock:
+            opened = self._opened.get(domain)
+            if opened is None:
+                return True
+            if time.time() - opened >= self.reset_after:
+                # half open: let one request through, a failure re-opens the circuit
+                self._opened[domain] = time.time()
+                logging.info(f"Trying domain {domain} again after {self.reset_after} seconds")
+                return True
+            self.stats["short_circuited"] += 1
+            return False
+
+    def is_open(self, domain: str) -> bool:
+        """True if requests to domain are being skipped, unlike allow() it does not count or start a trial"""
+        with self._lock:
+            return domain in self._opened
+
+    def record_success(self, domain: str):
+        with self._lock:
+            self._failures.pop(domain, None)
+            self._opened.pop(domain, None)
+
+    def record_failure(self, domain: str):
+        with self._lock:
+            self._failures[domain] = self._failures.get(domain, 0) + 1
+            if self._failures[domain] >= self.max_failures and domain not in self._opened:
+                self._opened[domain] = time.time()
+                self.stats["opened"] += 1
+                logging.warning(f"Domain {domain} failed {self._failures[domain]} times in a row, skipping it for {self.reset_after} seconds")
+            elif domain in self._opened:
+                self._opened[domain] = time.time()
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, open=len(self._opened))
+
+
+class RetryBudget(object):
+    """
+    Maximum number of retries for a whole run, so that failing sites can not use up all time
+    """
+    def __init__(self, max_retries: int):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def take(self) -> bool:
+        """Use one retry from the budget, returns False if the budget is spent"""
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            if self.used == self.max_retries:
+                logging.warning(f"Retry budget of {self.max_retries} retries is spent, failed requests will not be retried anymore")
+            return True
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait according to a Retry-After header, given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max((parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds(), 0.)
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float, cap: float, retry_after: Optional[float] = None) -> float:
+    """
+    Exponential backoff with full jitter: a random wait up to base * 2^attempt, at most cap
+    A Retry-After given by the server is used as minimum wait.
+    """
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
@@ -0,0 +1,163 @@
+from typing import Dict, Tuple
+import asyncio
+import logging
+import socket
+import threading
+import time
+
+
+class _Lookup(object):
+    """A lookup that is running in its own thread, callers for the same host wait for it together"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None  # addrinfo or the exception of the system resolver
+
+
+class DNSCache(object):
+    """
+    Process-wide DNS cache with positive and negative TTLs
+    Once installed, socket.getaddrinfo goes through this cache. HTMLFetcher (requests),
+    RobotsFetcher (requests) and the sitemap fetcher (usp) therefore all share the same lookups.
+    Installing is explicit, see install(); without it only resolve() uses the cache.
+    Lookups that take longer than the timeout fail for the caller, so dead domains fail fast. Such a lookup
+    keeps running in its own thread and its result is still cached when it arrives, but timeouts themselves
+    are not cached. At most max_pending lookups run at the same time, so hanging domains can not pile up threads.
+    """
+    def __init__(
+            self,
+            ttl: float = 3600,
+            negative_ttl: float = 900,
+            timeout: float = 3,
+            max_pending: int = 64):
+        """
+        :param ttl: Seconds a successful lookup is cached
+        :param negative_ttl: Seconds a failed lookup is cached, lookups that timed out are not cached
+        :param timeout: Seconds a caller waits for a lookup
+        :param max_pending: Lookups running at the same time, further lookups of new hosts fail right away
+        """
+        logging.info(f"Initializing DNSCache with ttl={ttl}, negative_ttl={negative_ttl} and timeout={timeout}")
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.timeout = timeout
+
+        self._getaddrinfo = socket.getaddrinfo  # the system resolver
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._cache: Dict[Tuple, Tuple[float, object]] = dict()  # {args: (expires, addrinfo or gaierror)}
+        self._pending: Dict[Tuple, _Lookup] = dict()  # {args: lookup still running}
+
+        self.stats = {"lookups": 0, "hits": 0, "negative_hits": 0, "failures": 0, "timeouts": 0, "overloaded": 0, "dns_time": 0.0}
+
+    def install(self):
+        """Route all socket.getaddrinfo calls in this process through the cache"""
+        if getattr(socket.getaddrinfo, "__self__", None) is self:
+            return
+        if isinstance(getattr(socket.getaddrinfo, "__self__", None), DNSCache):
+            logging.warning("Another DNSCache was installed before, it is replaced")
+        socket.getaddrinfo = self.getaddrinfo
+        logging.debug("DNSCache installed as resolver for this process")
+
+    def uninstall(self):
+        """Restore the system resolver"""
+        if getattr(socket.getaddrinfo, "__self__", None) is self:
+            socket.getaddrinfo = self._getaddrinfo
+
+    def _run(self, key: Tuple, lookup: _Lookup):
+        """Thread of a single lookup, caches the result even if the caller stopped waiting"""
+        try:
+            lookup.result = self._getaddrinfo(*key)
+            expires = time.time() + self.ttl
+        except socket.gaierror as e:
+            lookup.result = e
+            # a temporary failure is not a verdict on the domain
+            expires = None if e.errno == socket.EAI_AGAIN else time.time() + self.negative_ttl
+        except Exception as e:
+            lookup.result = e
+            expires = None
+        with self._lock:
+            if expires is not None:
+                self._cache[key] = (expires, lookup.result)
+            self._pending.pop(key, None)
+        self._slots.release()
+        lookup.done.set()
+
+    def getaddrinfo(self, host, port, family=0, type=0, proto=0, flags=0):
+        """Drop-in replacement for socket.getaddrinfo"""
+        key = (host, port, family, type, proto, flags)
+        now = time.time()
+
+        with self._lock:
+            self.stats["lookups"] += 1
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] > now:
+                if isinstance(cached[1], socket.gaierror):
+                    self.stats["negative_hits"] += 1
+                    raise cached[1]
+                self.stats["hits"] += 1
+                return cached[1]
+
+            lookup = self._pending.get(key)
+            if lookup is None:
+                if not self._slots.acquire(blocking=False):
+                    self.stats["overloaded"] += 1
+                    raise socket.gaierror(socket.EAI_AGAIN, f"Too many DNS lookups still running, not looking up {host}")
+                lookup = _Lookup()
+                self._pending[key] = lookup
+                threading.Thread(target=self._run, args=(key, lookup), name="dns", daemon=True).start()
+
+        time_start = time.time()
+        finished = lookup.done.wait(self.timeout)
+        with self._lock:
+            self.stats["dns_time"] += time.time() - time_start
+            if not finished:
+                self.stats["timeouts"] += 1
+            elif isinstance(lookup.result, Exception):
+                self.stats["failures"] += 1
+
+        if not finished:
+            logging.debug(f"DNS lookup for {host} did not finish within {self.timeout} seconds")
+            raise socket.gaierror(socket.EAI_AGAIN, f"DNS lookup timed out for {host}")
+        if isinstance(lookup.result, Exception):
+            logging.debug(f"DNS lookup failed for {host}: {lookup.result}")
+            raise lookup.result
+        return lookup.result
+
+    def resolve(self, host: str, port: int = 443) -> bool:
+        """Returns True if the host resolves"""
+        if not host:
+            return False
+        try:
+            self.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+            return True
+        except socket.gaierror:
+            return False
+
+    async def resolve_async(self, host: str, port: int = 443) -> bool:
+        """Async version of resolve, for use in an event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.resolve, host, port)
+
+    def evict_expired(self) -> int:
+        """Remove expired entries, returns how many were removed"""
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires, _) in self._cache.items() if expires <= now]
+            for key in expired:
+                del self._cache[key]
+        return len(expired)
+
+    def get_stats(self) -> Dict:
+        """Lookup counts and total time spent in DNS resolution"""
+        return dict(self.stats, entries=len(self._cache))
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    dnscache = DNSCache()
+    dnscache.install()
+
+    for host in ["cbs.nl", "books.toscrape.com", "cbs.nl", "does-not-exist.invalid", "does-not-exist.invalid"]:
+        print(host, dnscache.resolve(host))
+    print(dnscache.get_stats())
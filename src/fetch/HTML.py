@@ -1,15 +1,16 @@
-import requests
-from typing import Dict, Optional
+from typing import Dict, Iterator, Optional, Tuple, Union
 import time
-import random
 import urllib
 from urllib.parse import urlparse
 import logging
 
-from util import setup
-from .base import IFetcher
+from omegaconf import DictConfig
 
-CONFIG = setup("../config/config.yaml")
+from util import decode_html, HTMLBytes
+from .base import IFetcher
+from .DNS import DNSCache
+from .Breaker import CircuitBreaker, RetryBudget, parse_retry_after, backoff_delay
+from .Warc import WarcWriter
 
 
 class HTMLFetcher(IFetcher):
@@ -21,20 +22,42 @@ class HTMLFetcher(IFetcher):
     """
     def __init__(
             self,
+            config: DictConfig,
             user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            headers: Optional[Dict] = None):
+            headers: Optional[Dict] = None,
+            dnscache: Optional[DNSCache] = None):
         logging.info("Initializing HTMLFetcher")
         super(HTMLFetcher, self).__init__(user_agent=user_agent)
         self.user_agent = user_agent
         logging.debug(f"User agent given as: {user_agent}")
 
         self.timeout = (
-            CONFIG.requests.timeout_connect,
-            CONFIG.requests.timeout_read)
-        logging.debug(f"Timeout for connection is {CONFIG.requests.timeout_connect} seconds, for reading {CONFIG.requests.timeout_read} seconds")
+            config.requests.timeout_connect,
+            config.requests.timeout_read)
+        logging.debug(f"Timeout for connection is {config.requests.timeout_connect} seconds, for reading {config.requests.timeout_read} seconds")
+
+        self.max_retries = config.requests.max_retries
+        logging.debug(f"Maximum retries set to {config.requests.max_retries}")
+
+        # Retries back off exponentially, and domains that keep failing are skipped
+        self.retry_statuses = (429, 500, 502, 503, 504)
+        self.backoff_base = config.requests.backoff_base
+        self.backoff_max = config.requests.backoff_max
+        self.max_retry_after = config.requests.max_retry_after
+        self.retry_budget = RetryBudget(max_retries=config.requests.retry_budget)
+        self.breaker = CircuitBreaker(
+            max_failures=config.requests.breaker_failures,
+            reset_after=config.requests.breaker_reset)
+
+        # Limits on the response body, so that large or slow downloads are abandoned
+        self.max_bytes = config.requests.max_bytes
+        self.max_time = config.requests.max_time
+        self.chunk_size = 64 * 1024  # at most this much per read, a read returns whatever has arrived
+        logging.debug(f"Response body limited to {self.max_bytes} bytes and {self.max_time} seconds")
 
-        self.max_retries = CONFIG.requests.max_retries
-        logging.debug(f"Maximum retries set to {CONFIG.requests.max_retries}")
+        # Raw bytes can go straight to lxml based parsers, which find the encoding themselves
+        self.return_bytes = config.requests.return_bytes
+        logging.debug(f"Fetched html is returned as {'bytes' if self.return_bytes else 'str'}")
 
         self.headers = headers or {
             "User-Agent": self.user_agent,
@@ -46,14 +69,31 @@ class HTMLFetcher(IFetcher):
         headers_str = ', '.join([f"{k}: {v}" for k, v in self.headers.items()])
         logging.debug(f"Request headers set to {headers_str}")
 
+        # Optionally all responses are archived, so that pages can be processed again without crawling
+        self.warcwriter = None
+        if config.warc.write:
+            self.warcwriter = WarcWriter(dir_out=config.warc.dir, max_file_bytes=config.warc.max_file_bytes)
+
+        # DNS lookups are cached, shared with robots and sitemap fetching once the cache is installed for the process
+        self.dnscache = dnscache or DNSCache(
+            ttl=config.dns.ttl,
+            negative_ttl=config.dns.negative_ttl,
+            timeout=config.dns.timeout,
+            max_pending=config.dns.max_pending)
+
         # Domain will have to be identified for any given url to fetch, then the corresponding robots file will be checked
         # this is handled by RobotsFetcher
         from .Robots import RobotsFetcher
-        self.robotsfetcher = RobotsFetcher(user_agent=user_agent)
+        self.robotsfetcher = RobotsFetcher(
+            user_agent=user_agent,
+            dnscache=self.dnscache,
+            timeout=self.timeout,
+            max_bytes=config.robots.max_bytes,
+            cache_size=config.robots.cache_size)
         self._robots_bydomain = self.robotsfetcher.get_results()
 
     def resetResults(self):
-        self.results = {}
+        self.evict_results()
         return
 
     def is_allowed(self, url: str) -> bool:
@@ -63,24 +103,38 @@ class HTMLFetcher(IFetcher):
         domain = urlparse(url).netloc  # obtain domain from url
         logging.debug(f"The domain is identified as {domain}")
 
-        if not self._robots_bydomain.get(domain, False):
-            self.robotsfetcher.fetch(domain=domain)
-            self._robots_bydomain[domain].read()
-            logging.debug(f"A new robots file has been read for domain {domain}")
-        
-        # check if allowed
-        if self._robots_bydomain[domain].can_fetch(useragent=self.user_agent, url=url):
-            return True
-        else:
-            return False
+        rules = self._robots_bydomain.get(domain)
+        if rules is None:
+            # threads of the pipeline wait for a single download, only the one that downloaded reports it
+            rules, downloaded = self.robotsfetcher.fetch_once(domain=domain)
+            if downloaded and rules.error is not None:
+                # the robots file could not be read, which disallows all urls of the domain
+                logging.info(f"Could not read robots file for domain {domain}: {rules.error}")
+                self.breaker.record_failure(domain)
+            elif downloaded:
+                logging.debug(f"A new robots file has been read for domain {domain}")
+
+        # check if allowed, the rules of the domain are compiled once and decisions are cached per path prefix
+        return rules.allowed(url)
 
-    def fetch(self, url: str) -> str:
+    def fetch(self, url: str) -> Union[str, bytes]:
         """
         Fetches the HTML content of the given URL with retries and error handling.
         Returns a dictionary with the URL as key and the HTML content as value.
         """
         logging.info(f"Trying to fetch the next URL: {url}")
 
+        # unresolvable domains fail here, before robots, connect timeouts and retries
+        host = urlparse(url).hostname
+        if not self.dnscache.resolve(host):
+            logging.info(f"Given url skipped because its domain does not resolve: {url}")
+            return {}
+
+        # domains that keep failing are skipped, before reading their robots file
+        if not self.breaker.allow(urlparse(url).netloc):
+            logging.info(f"Given url skipped because its domain failed too often: {url}")
+            return {}
+
         # check if allowed
         logging.debug("Checking if url is allowed")
         if not self.is_allowed(url=url):
@@ -89,45 +143,177 @@ class HTMLFetcher(IFetcher):
 
         return self._fetch_with_retries(url)
 
-    def _fetch_with_retries(self, url: str, retries: int = 0):
+    def _fetch_with_retries(self, url: str):
         """
         Internal method that performs the request with retry logic.
+        Connection errors, timeouts and responses with a retryable status are retried with exponential
+        backoff, honouring Retry-After. Failures count towards the circuit breaker of the domain, 429 Too Many
+        Requests does not: the server is up and only asks to slow down.
+        The response is streamed: headers are checked before the body is read,
+        and the body is abandoned once it exceeds max_bytes or max_time.
         """
-        try:
-            response = requests.get(url, headers=self.headers, timeout=self.timeout)
+        import requests  # lazy import
 
-            # Check for HTTP errors
-            if response.status_code != 200:
-                logging.warning(f"Exited with response status: {response.status_code}")
-                return {}
+        domain = urlparse(url).netloc
+        attempt = 0
+        while True:
+            retry_after = None
+            throttled = False
+            failed = None  # response with a retryable status, archived only if it is not retried
+            try:
+                deadline = time.time() + self.max_time
+                with requests.get(url, headers=self.headers, timeout=self.timeout, stream=True) as response:
+
+                    # Check for HTTP errors, some are worth a retry
+                    if response.status_code in self.retry_statuses:
+                        logging.info(f"Request failed for {url} with response status: {response.status_code}")
+                        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                        throttled = response.status_code == 429
+                        failed = response
+                    elif response.status_code != 200:
+                        self.breaker.record_success(domain)  # the server is up
+                        self._archive(response=response, url=url)
+                        logging.warning(f"Exited with response status: {response.status_code}")
+                        return {}
+                    else:
+                        self.breaker.record_success(domain)
+                        return self._read_response(response=response, url=url, deadline=deadline)
 
-            # Check if content is HTML
-            if "text/html" not in response.headers.get("Content-Type", ""):
-                logging.info(f"Non-HTML content received for URL: {url}")
+            except (requests.exceptions.InvalidURL, requests.exceptions.InvalidSchema, requests.exceptions.MissingSchema) as e:
+                logging.info(f"Request failed for {url}, not retried. Error: {e}")
                 return {}
 
-            # Success
-            result = response.text
-            self.results[url] = result
-            return result
+            except requests.exceptions.RequestException as e:
+                # Handle exceptions
+                logging.info(f"Request failed for {url}. Error: {e}")
 
-        except requests.exceptions.RequestException as e:
-            # Handle exceptions
-            logging.info(f"Request failed for {url}. Error: {e}")
+            except urllib.error.URLError as e:
+                logging.info(f"Request failed with exception: {e}")
+                return {}
 
-            if retries < self.max_retries:
-                wait_time = random.uniform(1, 5)  # Random delay between 1 and 5 seconds
-                logging.info(f"Retrying in {wait_time:.2f} seconds...")
-                time.sleep(wait_time)
-                return self._fetch_with_retries(url, retries + 1)
+            # Failed, retry if allowed
+            if not throttled:
+                self.breaker.record_failure(domain)
+            if not self._retry(domain=domain, attempt=attempt, retry_after=retry_after):
+                if failed is not None:
+                    self._archive(response=failed, url=url)
+                return {}
 
+            wait_time = backoff_delay(attempt=attempt, base=self.backoff_base, cap=self.backoff_max, retry_after=retry_after)
+            logging.info(f"Retrying in {wait_time:.2f} seconds...")
+            time.sleep(wait_time)
+            attempt += 1
+
+    def _retry(self, domain: str, attempt: int, retry_after: Optional[float]) -> bool:
+        """True if a failed request may be retried, a retry is then taken from the budget"""
+        if attempt >= self.max_retries:
             # Max retries reached
+            return False
+        if retry_after is not None and retry_after > self.max_retry_after:
+            logging.info(f"Server asks to retry after {retry_after:.0f} seconds, more than the maximum of {self.max_retry_after}")
+            return False
+        return not self.breaker.is_open(domain) and self.retry_budget.take()
+
+    def _read_response(self, response, url: str, deadline: float):
+        """Check headers of a succesful response, then read and decode the body"""
+
+        # Check if content is HTML, before downloading the body
+        if "text/html" not in response.headers.get("Content-Type", ""):
+            logging.info(f"Non-HTML content received for URL: {url}")
+            self._archive(response=response, url=url)
             return {}
 
-        except urllib.error.URLError as e:
-            logging.info(f"Request failed with exception: {e}")
+        # Reject on announced size, before downloading the body
+        content_length = response.headers.get("Content-Length", "")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            logging.info(f"Content-Length {content_length} exceeds maximum of {self.max_bytes} bytes for URL: {url}")
+            self._archive(response=response, url=url, truncated="length")
             return {}
 
+        body, truncated = self._read_body(response=response, url=url, deadline=deadline)
+        if body is None:
+            self._archive(response=response, url=url, truncated=truncated)
+            return {}
+        self._archive(response=response, url=url, body=body)
+
+        # Success, the encoding is sniffed from the start of the body instead of detected over all of it
+        # undecoded bytes keep the Content-Type, so that parsers can still use the charset of the header
+        content_type = response.headers.get("Content-Type", "")
+        result = HTMLBytes(body, content_type=content_type) if self.return_bytes else decode_html(body=body, content_type=content_type)
+        self.store_result(url, result)
+        return result
+
+    def _read_body(self, response, url: str, deadline: float) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Read the streamed body in chunks.
+        Returns the body and None, or None and the reason it was abandoned: "length" if the body exceeds
+        max_bytes, "time" if it is still arriving after the deadline.
+        """
+        chunks = []
+        size = 0
+        for chunk in self._chunks(response=response, deadline=deadline):
+            if chunk is not None:
+                size += len(chunk)
+            if size > self.max_bytes:
+                logging.info(f"Body exceeds maximum of {self.max_bytes} bytes, aborted download of URL: {url}")
+                return None, "length"
+            if chunk is None or time.time() > deadline:
+                logging.info(f"Body not complete within {self.max_time} seconds, aborted download of URL: {url}")
+                return None, "time"
+            chunks.append(chunk)
+        return b"".join(chunks), None
+
+    def _chunks(self, response, deadline: float) -> Iterator[Optional[bytes]]:
+        """
+        Chunks of the body as they arrive, None once the deadline has passed
+        Every read returns what has arrived so far and the socket timeout is lowered to the time left, so a
+        server that trickles a few bytes at a time is stopped at the deadline, not after a full chunk.
+        """
+        import requests  # lazy import
+        from urllib3.exceptions import ReadTimeoutError, ProtocolError  # lazy import
+
+        raw = response.raw
+        if not hasattr(raw, "read1"):
+            yield from response.iter_content(chunk_size=self.chunk_size)
+            return
+        sock = getattr(getattr(raw, "_connection", None), "sock", None)
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    yield None
+                    return
+                if sock is not None:
+                    sock.settimeout(min(self.timeout[1], remaining))
+                try:
+                    chunk = raw.read1(amt=self.chunk_size, decode_content=True)
+                except ReadTimeoutError as e:
+                    if time.time() >= deadline:
+                        yield None
+                        return
+                    raise requests.exceptions.ConnectionError(e)
+                except ProtocolError as e:
+                    raise requests.exceptions.ChunkedEncodingError(e)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            if sock is not None and sock.fileno() != -1:
+                sock.settimeout(self.timeout[1])
+
+    def _archive(self, response, url: str, body: bytes = b"", truncated: Optional[str] = None):
+        """Write the response to the WARC archive, if archiving is on. Without a body it is marked as truncated"""
+        if self.warcwriter is None:
+            return
+        self.warcwriter.write(
+            url=url,
+            request_headers=dict(response.request.headers),
+            status=response.status_code,
+            reason=response.reason or "",
+            response_headers=dict(response.headers),
+            body=body,
+            truncated=truncated if truncated is not None or body else "unspecified")
+
     def get_results(self) -> Dict[str, str]:
         """
         Returns the dictionary of fetched URLs and their HTML content.
@@ -137,10 +323,14 @@ class HTMLFetcher(IFetcher):
 
 if __name__ == "__main__":
 
+    from util import setup
+
     logging.basicConfig(level=logging.DEBUG)
 
+    config = setup("../config/config.yaml")
     user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
     fetcher = HTMLFetcher(
+        config=config,
         user_agent=user_agent
     )
 
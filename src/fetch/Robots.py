@@ -1,42 +1,265 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Tuple, Union
 import logging
-from urllib.robotparser import RobotFileParser
-from usp.tree import sitemap_tree_for_homepage
+import re
+import threading
+from urllib.parse import quote, unquote, urlsplit
 
-from util import setup
 from .base import IFetcher
+from .DNS import DNSCache
 
-CONFIG = setup("../config/config.yaml")
+
+def _quote(path: str) -> str:
+    """Same percent-encoding for rules and urls, so that %7E and ~ match"""
+    return quote(unquote(path), safe="/")
+
+
+class RobotsRules(object):
+    """
+    Rules of a single robots.txt for a single user agent, compiled once
+    Rules without wildcards go into a prefix trie, which finds the longest matching rule in one walk over the path.
+    Rules with '*' are compiled to regexes, and only tried if they are longer than the best rule from the trie.
+    The longest matching rule decides, Allow wins from Disallow of the same length (RFC 9309).
+    Decisions are cached per path prefix: without '*' rules no rule looks beyond the longest rule,
+    so all paths that share that many characters get the same decision.
+    """
+    _END = ""  # key of the decision in a trie node
+
+    def __init__(self, rules: List[Tuple[str, bool]], crawl_delay: Optional[float] = None, sitemaps: Optional[List[str]] = None, cache_size: int = 10000):
+        """
+        :param rules: (path pattern, allowed) of the group that applies to the user agent
+        :param crawl_delay: Crawl-delay of that group, if any
+        :param sitemaps: Sitemap urls listed in the file
+        :param cache_size: Maximum number of cached decisions, the cache is emptied when it is full
+        """
+        self.crawl_delay = crawl_delay
+        self.sitemaps = sitemaps or []
+        self.cache_size = cache_size
+        self.error = None  # why the file could not be read, all urls are disallowed then
+        self.disallow_all = False
+
+        self._trie = dict()
+        self._exact = dict()  # {path: (length, allowed)} of rules ending in '$'
+        self._wildcards = []  # (length, allowed, regex) of rules with '*', longest first
+        horizon = 0
+        for pattern, allowed in rules:
+            if not pattern:
+                continue  # an empty Disallow allows everything
+            anchored = pattern.endswith("$")
+            pieces = [_quote(piece) for piece in (pattern[:-1] if anchored else pattern).split("*")]
+            length = len(pattern)
+            if len(pieces) > 1:
+                regex = re.compile(".*".join(re.escape(piece) for piece in pieces) + ("$" if anchored else ""), re.DOTALL)
+                self._wildcards.append((length, allowed, regex))
+                continue
+            path = pieces[0]
+            horizon = max(horizon, len(path))
+            if anchored:
+                self._add_exact(path=path, length=length, allowed=allowed)
+            else:
+                self._add_prefix(path=path, length=length, allowed=allowed)
+        self._wildcards.sort(key=lambda rule: (-rule[0], not rule[1]))
+        self._horizon = None if self._wildcards else horizon
+        self._decisions = dict()  # {path prefix: allowed}
+        self._lock = threading.Lock()  # rules of a domain are shared by the threads of the pipeline
+        self.stats = {"checks": 0, "cache_hits": 0}
+
+    def _add_prefix(self, path: str, length: int, allowed: bool):
+        node = self._trie
+        for char in path:
+            node = node.setdefault(char, dict())
+        if self._END not in node or allowed:
+            node[self._END] = (length, allowed)
+
+    def _add_exact(self, path: str, length: int, allowed: bool):
+        if path not in self._exact or allowed:
+            self._exact[path] = (length, allowed)
+
+    @classmethod
+    def parse(cls, text: str, user_agent: str, cache_size: int = 10000) -> "RobotsRules":
+        """
+        Compile the rules of a robots.txt that apply to user_agent
+        Groups are matched on the product token of the user agent (the part before the first '/'), like the
+        standard library does. All matching groups are merged, if none matches the '*' groups are used.
+        """
+        token = user_agent.split("/")[0].strip().lower()
+        groups = []  # (agents, rules, crawl delay)
+        sitemaps = []
+        agents, rules, delay = [], [], None
+        for line in text.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if ":" not in line:
+                continue
+            field, value = (part.strip() for part in line.split(":", 1))
+            field = field.lower()
+            if field == "user-agent":
+                if rules or delay is not None:
+                    groups.append((agents, rules, delay))
+                    agents, rules, delay = [], [], None
+                agents.append(value.split("/")[0].lower())
+            elif field in ("allow", "disallow") and agents:
+                rules.append((value, field == "allow"))
+            elif field == "crawl-delay" and agents:
+                try:
+                    delay = float(value)
+                except ValueError:
+                    pass
+            elif field == "sitemap":
+                sitemaps.append(value)
+        if agents:
+            groups.append((agents, rules, delay))
+
+        matching = [group for group in groups if any(agent != "*" and agent in token for agent in group[0])]
+        matching = matching or [group for group in groups if "*" in group[0]]
+        delays = [group[2] for group in matching if group[2] is not None]
+        return cls(
+            rules=[rule for group in matching for rule in group[1]],
+            crawl_delay=delays[0] if delays else None,
+            sitemaps=sitemaps,
+            cache_size=cache_size)
+
+    @classmethod
+    def disallowing_all(cls, error: str) -> "RobotsRules":
+        """Rules for a robots.txt that could not be read"""
+        rules = cls(rules=[])
+        rules.disallow_all = True
+        rules.error = error
+        return rules
+
+    def _decide(self, path: str) -> bool:
+        best = None  # (length, allowed)
+        node = self._trie
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            decision = node.get(self._END)
+            if decision is not None and (best is None or decision[0] > best[0] or (decision[0] == best[0] and decision[1])):
+                best = decision
+        exact = self._exact.get(path)
+        if exact is not None and (best is None or exact[0] > best[0] or (exact[0] == best[0] and exact[1])):
+            best = exact
+        for length, allowed, regex in self._wildcards:
+            if best is not None and length < best[0]:
+                break  # sorted longest first, no longer rule left
+            if regex.match(path):
+                if best is None or length > best[0] or allowed:
+                    best = (length, allowed)
+                break
+        return True if best is None else best[1]
+
+    def allowed(self, url: str) -> bool:
+        """True if url may be fetched"""
+        if self.disallow_all:
+            return False
+        parts = urlsplit(url)
+        path = _quote(f"{parts.path or '/'}?{parts.query}" if parts.query else parts.path or "/")
+        if path == "/robots.txt":
+            return True
+
+        key = path if self._horizon is None else path[:self._horizon + 1]
+        with self._lock:
+            self.stats["checks"] += 1
+            decision = self._decisions.get(key)
+            if decision is not None:
+                self.stats["cache_hits"] += 1
+                return decision
+        decision = self._decide(path)
+        with self._lock:
+            if len(self._decisions) >= self.cache_size:
+                self._decisions.clear()
+            self._decisions[key] = decision
+        return decision
 
 
 class RobotsFetcher(IFetcher):
     """
     Robots Fetcher for accessing information in robots file
+    Robots files are downloaded with a timeout and a size limit, and compiled once per domain.
+    As in the standard library, 401 and 403 disallow the whole domain and other 4xx statuses allow it.
+    Files that can not be downloaded disallow the whole domain.
     """
     def __init__(
             self,
-            user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"):
+            user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+            dnscache: Optional[DNSCache] = None,
+            timeout: Union[float, Tuple[float, float]] = (3, 7),
+            max_bytes: int = 512000,
+            cache_size: int = 10000):
+        """
+        :param timeout: Connect and read timeout in seconds for downloading a robots file
+        :param max_bytes: Only this much of a robots file is read, as in RFC 9309
+        :param cache_size: Maximum number of cached decisions per domain
+        """
         logging.info("Initializing RobotsFetcher")
         super(RobotsFetcher, self).__init__(user_agent=user_agent)
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.cache_size = cache_size
+
+        # shared with the HTMLFetcher, sitemaps of dead domains are skipped without a lookup
+        self.dnscache = dnscache
 
         # keep track of domains for which the robots file has already been fetched
         self.results = dict()
+        self._downloading = dict()  # {domain: lock held while its robots file is downloaded}
 
-    def fetch(self, domain: str) -> RobotFileParser:
-        """Fetches robots file for given url domain, if not already done"""
+    def fetch(self, domain: str) -> RobotsRules:
+        """Fetches and compiles robots file for given url domain, if not already done"""
+        return self.fetch_once(domain=domain)[0]
 
-        # only download robots in case it hasn't already
-        self.results.setdefault(domain, RobotFileParser(url=f"https://{domain}/robots.txt"))
-        return self.results[domain]
+    def fetch_once(self, domain: str) -> Tuple[RobotsRules, bool]:
+        """
+        Like fetch, also returns True if this call downloaded the robots file
+        Threads asking for the same domain at the same time wait for a single download.
+        """
+        rules = self.results.get(domain)
+        if rules is not None:
+            return rules, False
+        with self._results_lock:
+            lock = self._downloading.setdefault(domain, threading.Lock())
+        with lock:
+            rules = self.results.get(domain)
+            if rules is not None:
+                return rules, False
+            rules = self._download(domain=domain)
+            self.store_result(domain, rules)
+        with self._results_lock:
+            self._downloading.pop(domain, None)
+        return rules, True
+
+    def _download(self, domain: str) -> RobotsRules:
+        import requests  # lazy import
+
+        url = f"https://{domain}/robots.txt"
+        try:
+            with requests.get(url, headers={"User-Agent": self.user_agent}, timeout=self.timeout, stream=True) as response:
+                if response.status_code in (401, 403):
+                    logging.debug(f"Robots file of {domain} is forbidden, the domain is disallowed")
+                    return RobotsRules(rules=[("/", False)])
+                if 400 <= response.status_code < 500:
+                    logging.debug(f"No robots file for {domain}, the domain is allowed")
+                    return RobotsRules(rules=[])
+                if response.status_code != 200:
+                    return RobotsRules.disallowing_all(error=f"status {response.status_code}")
+                body = response.raw.read(self.max_bytes, decode_content=True)
+        except requests.exceptions.RequestException as e:
+            return RobotsRules.disallowing_all(error=str(e))
+        return RobotsRules.parse(text=body.decode("utf-8", errors="replace").lstrip("\ufeff"), user_agent=self.user_agent, cache_size=self.cache_size)
 
-    def get_results(self) -> Dict[str, RobotFileParser]:
+    def get_results(self) -> Dict[str, RobotsRules]:
         """
-        Returns the dictionary of fetched URLs and their HTML content.
+        Returns the dictionary of domains and their compiled robots rules.
         """
         return self.results
 
     def get_sitemap_urls(self, domain: str) -> List[str]:
         """Get a list of sitemaps listed on robots.txt"""
+        if self.dnscache is not None and not self.dnscache.resolve(domain.split(':')[0]):
+            logging.debug(f"No sitemap_urls for domain {domain}, since it does not resolve")
+            return []
+
+        from usp.tree import sitemap_tree_for_homepage  # lazy import, only needed when sitemaps are used
+
         try:
             tree = sitemap_tree_for_homepage(f"https://{domain}", use_robots=True, use_known_paths=False)
             sitemap_urls = [page.url for page in tree.all_pages()]
@@ -62,9 +285,9 @@ if __name__ == "__main__":
     for domain in domains:
         fetcher.fetch(domain)
 
-    for domain, robotsobject in fetcher.get_results().items():
-        print(f"Domain: {domain}")
-        print(robotsobject.path)
+    for domain, rules in fetcher.get_results().items():
+        print(f"Domain: {domain}, crawl delay: {rules.crawl_delay}, error: {rules.error}")
+        print(rules.allowed(f"https://{domain}/"), rules.sitemaps)
 
     for domain in domains:
         sitemaps = fetcher.get_sitemap_urls(domain=domain)
\ No newline at end of file
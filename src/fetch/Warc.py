@@ -0,0 +1,299 @@
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import base64
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+import zlib
+
+from util import decode_html, HTMLBytes
+from .base import IFetcher
+
+
+# Headers that describe the transfer, not the payload: requests has already undone them when the body is read
+_TRANSFER_HEADERS = ("content-encoding", "transfer-encoding", "content-length")
+
+
+def _warc_date() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _record(fields: Dict[str, str], block: bytes) -> bytes:
+    """A single WARC record, gzipped on its own so that it can be read from its offset"""
+    header = "WARC/1.1\r\n" + "".join(f"{key}: {value}\r\n" for key, value in fields.items())
+    header += f"Content-Length: {len(block)}\r\n\r\n"
+    return gzip.compress(header.encode("utf-8") + block + b"\r\n\r\n", compresslevel=6)
+
+
+class WarcWriter(object):
+    """
+    Archives raw requests and responses in WARC files, one gzip member per record
+    Next to every WARC file a CDXJ index is kept with the offset and length of each response record,
+    so that single pages can be read back without decompressing the whole file.
+    A new file is started once a file exceeds max_file_bytes.
+    """
+    def __init__(self, dir_out: str, prefix: str = "webfocusedscrape", max_file_bytes: int = 1000000000):
+        logging.info(f"Initializing WarcWriter, responses are archived in: {dir_out}")
+        self.dir_out = dir_out
+        self.prefix = prefix
+        self.max_file_bytes = max_file_bytes
+        os.makedirs(dir_out, exist_ok=True)
+
+        self._lock = threading.Lock()  # crawl and fetch stages share the fetcher
+        self._file = None
+        self._index = None
+        self._filename = None
+        self._count = 0
+        self.stats = {"files": 0, "records": 0, "bytes": 0}
+
+    def _open(self):
+        """Start a new WARC file with a warcinfo record"""
+        self.close()
+        self._count += 1
+        self._filename = f"{self.prefix}-{datetime.now().strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{self._count:05d}.warc.gz"
+        self._file = open(os.path.join(self.dir_out, self._filename), 'wb')
+        self._index = open(os.path.join(self.dir_out, f"{self._filename}.cdxj"), 'w', encoding='utf-8')
+        self.stats["files"] += 1
+        logging.info(f"Writing responses to WARC file: {self._filename}")
+
+        info = "software: webfocusedscrape\r\nformat: WARC File Format 1.1\r\n".encode("utf-8")
+        self._file.write(_record(
+            fields={
+                "WARC-Type": "warcinfo",
+                "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+                "WARC-Date": _warc_date(),
+                "WARC-Filename": self._filename,
+                "Content-Type": "application/warc-fields"},
+            block=info))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._index.close()
+            self._file = None
+            self._index = None
+
+    def write(
+            self,
+            url: str,
+            request_headers: Dict[str, str],
+            status: int,
+            reason: str,
+            response_headers: Dict[str, str],
+            body: bytes = b"",
+            truncated: Optional[str] = None):
+        """
+        Archive a request and its response
+        :param truncated: Reason the body is missing or incomplete (length, time, unspecified), None if complete
+        """
+        parts = urlsplit(url)
+        target = parts.path or "/"
+        target += f"?{parts.query}" if parts.query else ""
+        request = f"GET {target} HTTP/1.1\r\nHost: {parts.netloc}\r\n"
+        request += "".join(f"{key}: {value}\r\n" for key, value in request_headers.items())
+        request = (request + "\r\n").encode("utf-8")
+
+        # The payload is stored as received by the parser, so transfer headers are replaced by its actual length
+        response = f"HTTP/1.1 {status} {reason}\r\n"
+        response += "".join(f"{key}: {value}\r\n" for key, value in response_headers.items() if key.lower() not in _TRANSFER_HEADERS)
+        response += f"Content-Length: {len(body)}\r\n\r\n"
+        response = response.encode("utf-8") + body
+
+        date = _warc_date()
+        response_id = f"<urn:uuid:{uuid.uuid4()}>"
+        response_fields = {
+            "WARC-Type": "response",
+            "WARC-Record-ID": response_id,
+            "WARC-Date": date,
+            "WARC-Target-URI": url,
+            "Content-Type": "application/http;msgtype=response",
+            "WARC-Payload-Digest": f"sha1:{base64.b32encode(hashlib.sha1(body).digest()).decode('ascii')}"}
+        if truncated is not None:
+            response_fields["WARC-Truncated"] = truncated
+        response_record = _record(fields=response_fields, block=response)
+        request_record = _record(
+            fields={
+                "WARC-Type": "request",
+                "WARC-Record-ID": f"<urn:uuid:{uuid.uuid4()}>",
+                "WARC-Date": date,
+                "WARC-Target-URI": url,
+                "WARC-Concurrent-To": response_id,
+                "Content-Type": "application/http;msgtype=request"},
+            block=request)
+
+        with self._lock:
+            if self._file is None or self._file.tell() >= self.max_file_bytes:
+                self._open()
+            offset = self._file.tell()
+            self._file.write(response_record)
+            self._file.write(request_record)
+            self._file.flush()
+
+            entry = {"url": url, "status": status, "filename": self._filename, "offset": offset, "length": len(response_record)}
+            if truncated is not None:
+                entry["truncated"] = truncated
+            self._index.write(f"{url} {date.replace('-', '').replace(':', '').replace('T', '')[:14]} {json.dumps(entry)}\n")
+            self._index.flush()
+
+            self.stats["records"] += 2
+            self.stats["bytes"] += len(response_record) + len(request_record)
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+def iter_records(path: str) -> Iterator[Tuple[int, int, bytes]]:
+    """(offset, length, record) of every gzip member in a WARC file"""
+    with open(path, 'rb') as file_in:
+        offset = 0
+        buffer = b""
+        while True:
+            decompressor = zlib.decompressobj(wbits=31)
+            chunks = []
+            length = 0
+            while not decompressor.eof:
+                if not buffer:
+                    buffer = file_in.read(1024 * 1024)
+                    if not buffer:
+                        return  # end of file, or a record cut off
+                chunks.append(decompressor.decompress(buffer))
+                length += len(buffer) - len(decompressor.unused_data)
+                buffer = decompressor.unused_data
+            yield offset, length, b"".join(chunks)
+            offset += length
+
+
+def _parse_response(record: bytes) -> Tuple[Dict[str, str], int, Dict[str, str], bytes]:
+    """WARC fields, HTTP status, HTTP headers and payload of a response record"""
+    warc_header, _, block = record.partition(b"\r\n\r\n")
+    fields = dict(line.split(": ", 1) for line in warc_header.decode("utf-8").split("\r\n")[1:] if ": " in line)
+    block = block[:int(fields.get("Content-Length", len(block)))]
+
+    http_header, _, payload = block.partition(b"\r\n\r\n")
+    lines = http_header.decode("iso-8859-1").split("\r\n")
+    status = int(lines[0].split(" ")[1]) if len(lines[0].split(" ")) > 1 and lines[0].split(" ")[1].isdigit() else 0
+    headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+    return fields, status, headers, payload
+
+
+def index_warc(path: str) -> str:
+    """Write a CDXJ index for a WARC file that has none, e.g. one written by another crawler, returns its path"""
+    path_index = f"{path}.cdxj"
+    filename = os.path.basename(path)
+    with open(path_index, 'w', encoding='utf-8') as file_out:
+        for offset, length, record in iter_records(path):
+            fields, status, _, _ = _parse_response(record)
+            if fields.get("WARC-Type") != "response":
+                continue
+            entry = {"url": fields["WARC-Target-URI"], "status": status, "filename": filename, "offset": offset, "length": length}
+            if "WARC-Truncated" in fields:
+                entry["truncated"] = fields["WARC-Truncated"]
+            date = fields.get("WARC-Date", "").replace('-', '').replace(':', '').replace('T', '')[:14]
+            file_out.write(f"{entry['url']} {date} {json.dumps(entry)}\n")
+    logging.info(f"Indexed WARC file: {path}")
+    return path_index
+
+
+class ReplayFetcher(IFetcher):
+    """
+    Fetcher that serves pages from WARC archives instead of the web
+    No network requests and no robots checks: the archive only holds what was allowed when it was written.
+    For a url archived more than once, the latest response is served.
+    WARC files without an index are indexed first.
+    """
+    def __init__(self, warc_dir: str, return_bytes: bool = False):
+        logging.info(f"Initializing ReplayFetcher, pages are served from WARC files in: {warc_dir}")
+        super(ReplayFetcher, self).__init__()
+        self.warc_dir = warc_dir
+        self.return_bytes = return_bytes
+        self.stats = {"hits": 0, "misses": 0}
+
+        for path in sorted(glob.glob(os.path.join(warc_dir, "*.warc.gz"))):
+            if not os.path.exists(f"{path}.cdxj"):
+                index_warc(path)
+
+        # {url: (timestamp, entry)}, the latest response per url
+        self._index = dict()
+        for path in sorted(glob.glob(os.path.join(warc_dir, "*.warc.gz.cdxj"))):
+            with open(path, 'r', encoding='utf-8') as file_in:
+                for line in file_in:
+                    url, timestamp, entry = line.rstrip("\n").split(" ", 2)
+                    if url not in self._index or timestamp >= self._index[url][0]:
+                        self._index[url] = (timestamp, json.loads(entry))
+        logging.info(f"ReplayFetcher found {len(self._index)} archived urls")
+
+    def fetch(self, url: str) -> Union[str, bytes]:
+        """Reads the archived html of the given url, returns an empty dictionary if there is none"""
+        logging.info(f"Trying to replay the next URL: {url}")
+
+        found = self._index.get(url)
+        if found is None:
+            logging.debug(f"Url not found in archive: {url}")
+            self.stats["misses"] += 1
+            return {}
+        entry = found[1]
+        self.stats["hits"] += 1
+        if entry["status"] != 200 or entry.get("truncated"):
+            logging.debug(f"Archived response for {url} has status {entry['status']}, truncated: {entry.get('truncated', False)}")
+            return {}
+
+        with open(os.path.join(self.warc_dir, entry["filename"]), 'rb') as file_in:
+            file_in.seek(entry["offset"])
+            record = gzip.decompress(file_in.read(entry["length"]))
+        _, _, headers, payload = _parse_response(record)
+
+        content_type = next((value for key, value in headers.items() if key.lower() == "content-type"), "")
+        if "text/html" not in content_type:
+            logging.info(f"Non-HTML content archived for URL: {url}")
+            return {}
+
+        result = HTMLBytes(payload, content_type=content_type) if self.return_bytes else decode_html(body=payload, content_type=content_type)
+        self.store_result(url, result)
+        return result
+
+    def get_results(self) -> Dict[str, str]:
+        """
+        Returns the dictionary of fetched URLs and their HTML content.
+        """
+        return self.results
+
+    def get_urls(self) -> List[str]:
+        """All archived urls"""
+        return list(self._index)
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+
+    import tempfile
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    with tempfile.TemporaryDirectory() as dir_warc:
+        writer = WarcWriter(dir_out=dir_warc)
+        writer.write(
+            url="https://books.toscrape.com/",
+            request_headers={"User-Agent": "webfocusedscrape"},
+            status=200,
+            reason="OK",
+            response_headers={"Content-Type": "text/html; charset=utf-8"},
+            body="<html><body>Hello café</body></html>".encode("utf-8"))
+        writer.write(
+            url="https://books.toscrape.com/missing.html",
+            request_headers={"User-Agent": "webfocusedscrape"},
+            status=404,
+            reason="Not Found",
+            response_headers={"Content-Type": "text/html"})
+        writer.close()
+
+        fetcher = ReplayFetcher(warc_dir=dir_warc)
+        for url in fetcher.get_urls():
+            print(url, fetcher.fetch(url))
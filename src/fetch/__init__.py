@@ -1,3 +1,5 @@
 from fetch.base import IFetcher, NoFetcher
-from fetch.Robots import RobotsFetcher
-from fetch.HTML import HTMLFetcher
\ No newline at end of file
+from fetch.DNS import DNSCache
+from fetch.Robots import RobotsFetcher, RobotsRules
+from fetch.HTML import HTMLFetcher
+from fetch.Warc import WarcWriter, ReplayFetcher
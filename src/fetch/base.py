@@ -1,7 +1,10 @@
 import logging
+import threading
 from abc import ABC, abstractmethod
 from typing import Dict
 
+from util import sizeof_values
+
 
 class IFetcher(ABC):
     """
@@ -12,6 +15,22 @@ class IFetcher(ABC):
             user_agent: str = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"):
         self.user_agent = user_agent
         self.results = {}  # {url: html_content}
+        self._results_lock = threading.Lock()  # stages of the pipeline fetch from different threads
+
+    def store_result(self, url: str, result):
+        with self._results_lock:
+            self.results[url] = result
+
+    def evict_results(self) -> int:
+        """Empty the results, returns the number of results evicted"""
+        with self._results_lock:
+            evicted = len(self.results)
+            self.results.clear()
+        return evicted
+
+    def results_nbytes(self) -> int:
+        with self._results_lock:
+            return sizeof_values(self.results)
 
     @abstractmethod
     def fetch(self, url: str):
@@ -40,8 +59,8 @@ class NoFetcher(IFetcher):
 
     def fetch(self, url: str) -> str:
         """Fetches default minimal html"""
-        self.results[url] = self._default_html
-        return self.results[url]
+        self.store_result(url, self._default_html)
+        return self._default_html
 
     def get_results(self) -> Dict[str, str]:
         """
@@ -1,46 +1,63 @@
 import os
-from omegaconf import OmegaConf
-from util import setup
+import argparse
 import logging
 from datetime import datetime
 import time
 
-from scrape import build_webfocusedscraper
-
+from omegaconf import DictConfig, OmegaConf
 
-CONFIG = setup("../config/config.yaml")
+from util import setup
+from scrape import build_webfocusedscraper
 
 
-def main():
+def main(config: DictConfig):
     """
     Crawl given urls to fetch relevant content from HTML
     """
 
-    user_agent = CONFIG.requests.useragent
-    scraper = build_webfocusedscraper(user_agent=user_agent)
+    scraper = build_webfocusedscraper(config=config)
     scraper.scrape()
 
 
-if __name__ == "__main__":
+def setup_logging(config: DictConfig):
+    """Log to a timestamped file in the logs folder of the output directory"""
 
-    LOG_FILE = f"{CONFIG.output.output_dir}/{CONFIG.output.logs}"
-    if not os.path.exists(LOG_FILE):
-        os.makedirs(LOG_FILE)
-    LOG_FILE = f"{LOG_FILE}/{datetime.fromtimestamp(time.time()).strftime('%Y%m%d_%H%M%S')}_offset{CONFIG.input.url_offset}_testing-refactor.log"
+    log_dir = f"{config.output.output_dir}/{config.output.logs}"
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = f"{log_dir}/{datetime.fromtimestamp(time.time()).strftime('%Y%m%d_%H%M%S')}_offset{config.input.url_offset}_testing-refactor.log"
     logFormatter = logging.Formatter("%(levelname)s %(asctime)s %(processName)s %(message)s")
-    fileHandler = logging.FileHandler("{0}".format(LOG_FILE))
+    fileHandler = logging.FileHandler("{0}".format(log_file))
     fileHandler.setFormatter(logFormatter)
     rootLogger = logging.getLogger()
     rootLogger.addHandler(fileHandler)
     rootLogger.setLevel(logging.INFO)
 
+
+def cli():
+    """
+    Command line entry point, reads the config file once and passes it on
+    """
+    argparser = argparse.ArgumentParser(description="Focused scraping of given base-urls")
+    argparser.add_argument("--config", default="../config/config.yaml", help="path to the config.yaml file")
+    argparser.add_argument("--profile", action="store_true", help="sample where time goes, per base-url, see profile in the config")
+    args = argparser.parse_args()
+
+    config = setup(args.config)
+    if args.profile:
+        config.profile.enabled = True
+    setup_logging(config=config)
+
     logging.info("Config:")
-    logging.info(OmegaConf.to_yaml(CONFIG))
+    logging.info(OmegaConf.to_yaml(config))
+
+    main(config=config)
 
-    main()
+
+if __name__ == "__main__":
+
+    cli()
 
     # # Read the output files by using the following syntax:
-    # CONFIG = setup("../config/config.yaml")
-    # df = pd.read_parquet(f"{CONFIG.output.output_dir}/20260304_080625", engine="pyarrow")
+    # config = setup("../config/config.yaml")
+    # df = pd.read_parquet(f"{config.output.output_dir}/20260304_080625", engine="pyarrow")
     # print(df.head())
-
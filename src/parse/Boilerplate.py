@@ -0,0 +1,65 @@
+from collections import Counter
+from typing import Dict, List
+import logging
+
+
+class BoilerplateFilter(object):
+    """
+    Removes text blocks that repeat on many pages of the same site, like cookie banners, menus and footers
+    Parsed text is split into lines, and every line is reduced to a fingerprint. Lines whose fingerprint
+    occurs on more than max_share of the pages of a site are removed from all its pages.
+    Only a count per distinct fingerprint is kept, not the lines themselves.
+    """
+    def __init__(self, max_share: float = 0.5, min_pages: int = 4):
+        """
+        :param max_share: Lines on more than this share of the pages are boilerplate
+        :param min_pages: Sites with fewer pages are left as they are, too few to tell boilerplate from content
+        """
+        logging.info(f"Initializing BoilerplateFilter, lines on more than {max_share:.0%} of the pages of a site are removed")
+        self.max_share = max_share
+        self.min_pages = min_pages
+        self.stats = {"sites": 0, "lines_removed": 0, "chars_before": 0, "chars_after": 0}
+
+    @staticmethod
+    def _fingerprint(line: str) -> int:
+        """Same fingerprint for lines that only differ in case or whitespace"""
+        return hash(" ".join(line.lower().split()))
+
+    def filter(self, contents: List[str]) -> List[str]:
+        """Contents of all pages of a single site without boilerplate lines, in the same order"""
+        if len(contents) < self.min_pages:
+            return contents
+
+        # document frequency: on how many pages does each line occur
+        frequency = Counter()
+        for content in contents:
+            frequency.update({self._fingerprint(line) for line in content.split("\n")})
+        boilerplate = {fingerprint for fingerprint, pages in frequency.items() if pages > self.max_share * len(contents)}
+        del frequency
+        if not boilerplate:
+            return contents
+
+        filtered = []
+        for content in contents:
+            lines = content.split("\n")
+            kept = [line for line in lines if self._fingerprint(line) not in boilerplate]
+            self.stats["lines_removed"] += len(lines) - len(kept)
+            filtered.append("\n".join(kept))
+
+        self.stats["sites"] += 1
+        self.stats["chars_before"] += sum(len(content) for content in contents)
+        self.stats["chars_after"] += sum(len(content) for content in filtered)
+        return filtered
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    menu = "Home\nOver ons\nWerken bij\nWij gebruiken cookies. Akkoord?"
+    pages = [f"{menu}\nVacature {i}: data scientist\nUren: {32 + i}\nSolliciteer\n© 2025 CBS" for i in range(5)]
+    for page in BoilerplateFilter().filter(pages):
+        print(page.replace("\n", " | "))
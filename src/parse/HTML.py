@@ -1,6 +1,8 @@
 import logging
 from abc import ABC, abstractmethod
-from bs4 import BeautifulSoup
+from typing import Union
+
+from util import decode_html
 
 
 class IHTMLParser(ABC):
@@ -9,7 +11,7 @@ class IHTMLParser(ABC):
     """
 
     @abstractmethod
-    def parse(self, html: str) -> str:
+    def parse(self, html: Union[str, bytes]) -> str:
         raise NotImplementedError("Do not call abstract base class.")
 
 
@@ -21,7 +23,7 @@ class EmptystringParser(IHTMLParser):
         logging.info("This testing extractor just returns an empty string for any given html")
         pass
 
-    def parse(self, html: str) -> str:
+    def parse(self, html: Union[str, bytes]) -> str:
         return ''
 
 
@@ -29,14 +31,19 @@ class HTMLBodyParser(IHTMLParser):
     """
     Parse the main human-readable text from a web page
     using BeautifulSoup.
-    Accepts raw HTML as input.
+    Accepts raw HTML as input, either as str or as undecoded bytes, which keep their header charset (see HTMLBytes).
     """
     def __init__(self):
         logging.info("Initializing parser that will look for main content in html using BeautifulSoup")
         self._disregard = ["script", "style", "nav", "footer", "header", "aside"]
         logging.debug(f"Extractor disregards tags: {', '.join(self._disregard)}")
 
-    def parse(self, html: str) -> str:
+    def parse(self, html: Union[str, bytes]) -> str:
+        from bs4 import BeautifulSoup  # lazy import
+
+        if isinstance(html, bytes):
+            html = decode_html(body=html)
+
         try: 
             soup = BeautifulSoup(html, "html.parser")
 
@@ -48,7 +55,8 @@ class HTMLBodyParser(IHTMLParser):
             return text
         except Exception as e:
             # Handle exceptions
-            logging.debug(f"Parsing HTML failed for {url}. Error: {e}")
+            logging.debug(f"Parsing HTML failed. Error: {e}")
+            return ''
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import logging
+from abc import ABC, abstractmethod
+from typing import Hashable, List, Optional, Set, Tuple, Union
+from urllib.parse import urljoin, urlsplit
+
+from util import decode_html, sniff_encoding
+
+
+class ILinkExtractor(ABC):
+    """
+    Interface class for link extraction
+    """
+
+    @abstractmethod
+    def extract(self, url: str, html: Union[str, bytes], known: Optional[Set[Hashable]] = None) -> List[str]:
+        """
+        Returns the absolute URLs of all links on the page, in order of appearance and without duplicates
+        Hrefs whose key (see LinkResolver.key) is in known are skipped before they are resolved, the keys of
+        the page are added to known.
+        """
+        raise NotImplementedError("Do not call abstract base class.")
+
+    def extract_anchors(self, url: str, html: Union[str, bytes], known: Optional[Set[Hashable]] = None) -> List[Tuple[str, str]]:
+        """Like extract, with the anchor text of each link. Extractors that do not collect text return empty texts"""
+        return [(link, "") for link in self.extract(url=url, html=html, known=known)]
+
+
+class LinkResolver(object):
+    """
+    Resolves the hrefs of a single page against its base URL
+    The base is parsed once, root-relative and absolute hrefs are handled without urljoin.
+    Links to other schemes (mailto, tel, javascript) are dropped.
+    """
+    _skip_schemes = ("mailto:", "tel:", "javascript:", "data:", "ftp:", "file:", "sms:", "whatsapp:")
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        parts = urlsplit(base_url)
+        self._root = f"{parts.scheme}://{parts.netloc}"
+        self._scheme = parts.scheme
+
+    def resolve(self, href: str) -> Optional[str]:
+        href = href.strip()
+        if not href or href[0] == '#':
+            return None  # same page
+        if href.startswith(("https://", "http://")):
+            return href
+        if href.startswith("//"):
+            return f"{self._scheme}:{href}"
+        if href[0] == '/' and "/." not in href:
+            return self._root + href
+        if href.lower().startswith(self._skip_schemes):
+            return None
+        return urljoin(self.base_url, href)
+
+    def key(self, href: str) -> Hashable:
+        """
+        Identifies the URL a raw href resolves to from this page without building it
+        Absolute and root-relative hrefs share their key across the pages of a site, as the crawl does not treat
+        a link the same from every site it jumps to.
+        """
+        if href.startswith(("https://", "http://", "/")) and not href.startswith("//"):
+            return self._root, href
+        return self.base_url, href
+
+    def unknown(self, items: List, known: Optional[Set[Hashable]], href=lambda item: item) -> List:
+        """Items whose href is not in known yet, adds the hrefs of all items to known"""
+        if known is None:
+            return items
+        keys = [self.key(href(item)) for item in items]
+        new = [item for item, key in zip(items, keys) if key not in known]
+        known.update(keys)
+        return new
+
+    def resolve_all(self, hrefs: List[str], known: Optional[Set[Hashable]] = None) -> List[str]:
+        """Resolve unique hrefs that are not known, keeps the order of first appearance"""
+        hrefs = self.unknown(list(dict.fromkeys(hrefs)), known=known)
+        resolved = (self.resolve(href) for href in dict.fromkeys(hrefs))
+        return list(dict.fromkeys(url for url in resolved if url is not None))
+
+    def resolve_anchors(self, anchors: List[Tuple[str, str]], known: Optional[Set[Hashable]] = None) -> List[Tuple[str, str]]:
+        """Resolve (href, text) pairs that are not known, texts of links to the same url are joined, keeps the order of first appearance"""
+        anchors = self.unknown(anchors, known=known, href=lambda anchor: anchor[0])
+        texts = dict()
+        for href, text in anchors:
+            url = self.resolve(href)
+            if url is None:
+                continue
+            if text and texts.get(url):
+                texts[url] = f"{texts[url]} {text}"
+            else:
+                texts[url] = texts.get(url) or text
+        return list(texts.items())
+
+
+class _HrefCollector(object):
+    """
+    lxml parser target that only keeps the href of <a> and <base> start tags, no tree is built
+    With anchors=True the text, title and image alt texts inside each <a> are kept as well.
+    """
+    def __init__(self, anchors: bool = False):
+        self.base = None
+        self.hrefs = []
+        self.anchors = anchors
+        self.texts = []  # per href, list of text parts
+        self._text = None  # text parts of the open <a>
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href:
+                self.hrefs.append(href)
+                if self.anchors:
+                    self._text = [f"{attrib.get('title', '')} "]
+                    self.texts.append(self._text)
+        elif tag == "img" and self._text is not None:
+            self._text.append(f" {attrib.get('alt', '')} ")
+        elif tag == "base" and self.base is None:
+            self.base = attrib.get("href")
+
+    def end(self, tag):
+        if tag == "a":
+            self._text = None
+
+    def data(self, data):
+        if self._text is not None:
+            self._text.append(data)
+
+    def close(self):
+        return self
+
+
+class LxmlLinkExtractor(ILinkExtractor):
+    """
+    Fast link extraction using the lxml (libxml2) HTML tokenizer with a parser target
+    Only start tags are handed to Python, so no document tree is built.
+    <base href> is respected when resolving relative links.
+    Undecoded bytes are parsed directly, with the charset of their Content-Type (see HTMLBytes) or the encoding
+    sniffed from the start of the page.
+    """
+    def __init__(self):
+        logging.info("Initializing link extractor using the lxml tokenizer")
+
+    def _collect(self, url: str, html: Union[str, bytes], anchors: bool) -> Tuple[_HrefCollector, LinkResolver]:
+        from lxml import etree  # lazy import
+
+        collector = _HrefCollector(anchors=anchors)
+        encoding = sniff_encoding(body=html) if isinstance(html, bytes) else None
+        parser = etree.HTMLParser(target=collector, recover=True, no_network=True, encoding=encoding)
+        try:
+            parser.feed(html)
+            parser.close()
+        except etree.LxmlError as e:
+            logging.debug(f"Link extraction stopped early for {url}. Error: {e}")
+
+        base_url = urljoin(url, collector.base.strip()) if collector.base else url
+        return collector, LinkResolver(base_url=base_url)
+
+    def extract(self, url: str, html: Union[str, bytes], known: Optional[Set[Hashable]] = None) -> List[str]:
+        collector, resolver = self._collect(url=url, html=html, anchors=False)
+        return resolver.resolve_all(collector.hrefs, known=known)
+
+    def extract_anchors(self, url: str, html: Union[str, bytes], known: Optional[Set[Hashable]] = None) -> List[Tuple[str, str]]:
+        collector, resolver = self._collect(url=url, html=html, anchors=True)
+        texts = (" ".join("".join(parts).split()) for parts in collector.texts)
+        return resolver.resolve_anchors(list(zip(collector.hrefs, texts)), known=known)
+
+
+class SoupLinkExtractor(ILinkExtractor):
+    """
+    Link extraction using BeautifulSoup, builds the full document tree
+    """
+    def __init__(self):
+        logging.info("Initializing link extractor using BeautifulSoup")
+
+    def extract(self, url: str, html: Union[str, bytes], known: Optional[Set[Hashable]] = None) -> List[str]:
+        from bs4 import BeautifulSoup  # lazy import
+
+        if isinstance(html, bytes):
+            html = decode_html(body=html)
+        soup = BeautifulSoup(html, "html.parser")
+        base = soup.find("base", href=True)
+        base_url = urljoin(url, base["href"].strip()) if base is not None else url
+        return LinkResolver(base_url=base_url).resolve_all([link["href"] for link in soup.find_all("a", href=True)], known=known)
+
+    def extract_anchors(self, url: str, html: Union[str, bytes], known: Optional[Set[Hashable]] = None) -> List[Tuple[str, str]]:
+        from bs4 import BeautifulSoup  # lazy import
+
+        if isinstance(html, bytes):
+            html = decode_html(body=html)
+        soup = BeautifulSoup(html, "html.parser")
+        base = soup.find("base", href=True)
+        base_url = urljoin(url, base["href"].strip()) if base is not None else url
+        anchors = [
+            (link["href"], " ".join(f"{link.get('title', '')} {link.get_text(' ')} {' '.join(img.get('alt', '') for img in link.find_all('img'))}".split()))
+            for link in soup.find_all("a", href=True)]
+        return LinkResolver(base_url=base_url).resolve_anchors(anchors, known=known)
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    html = """
+<html><head><base href="https://books.toscrape.com/catalogue/"></head>
+<body>
+<a href="page-2.html">next</a> <a href="/index.html">home</a> <a href="#top">top</a>
+<a href="mailto:info@books.toscrape.com">mail</a> <a href="//cdn.toscrape.com/x">cdn</a> <a href="page-2.html">again</a>
+</body></html>"""
+
+    for extractor in [LxmlLinkExtractor(), SoupLinkExtractor()]:
+        print(type(extractor).__name__, extractor.extract(url="https://books.toscrape.com", html=html))
+        print(type(extractor).__name__, extractor.extract_anchors(url="https://books.toscrape.com", html=html))
@@ -0,0 +1,68 @@
+from collections import Counter
+from typing import Dict, List, Tuple
+import logging
+import re
+
+
+# numbered backreferences, named groups and global inline flags break once a keyword is wrapped in a group
+_UNCOMBINABLE = re.compile(r"\\[1-9]|\\g<|\(\?P[<=]|\(\?[aiLmsux]+\)")
+
+
+def combinable(keyword: str) -> bool:
+    """True if the keyword can be part of a combined regex of alternatives, each wrapped in a group"""
+    return not _UNCOMBINABLE.search(keyword)
+
+
+class KeywordTagger(object):
+    """
+    Finds target keywords in the parsed content of pages
+    All keywords are combined into a single regex, so each page is searched in one pass however many keywords
+    there are. A stretch of text counts for the first keyword in the list that matches it. Keywords with
+    backreferences, named groups or global inline flags would break once combined, they are searched for separately.
+    Only counts and names of the matched keywords are kept, not the matches themselves.
+    """
+    def __init__(self, keywords: List[str], case_sensitive: bool = False):
+        """
+        :param keywords: Regexes to search for, e.g. the target keywords of the crawl, empty keywords are left out
+        :param case_sensitive: False to match keywords regardless of case
+        """
+        logging.info(f"Initializing KeywordTagger with {len(keywords)} keywords")
+        self.keywords = [keyword for keyword in dict.fromkeys(keywords) if keyword.strip()]
+        if len(self.keywords) < len(set(keywords)):
+            logging.info(f"Left out {len(set(keywords)) - len(self.keywords)} empty keywords, they would match everywhere")
+        flags = 0 if case_sensitive else re.IGNORECASE
+        combined = [keyword for keyword in self.keywords if combinable(keyword)]
+        pattern = "|".join(f"(?P<k{i}>{keyword})" for i, keyword in enumerate(combined)) or "(?!)"
+        self._pattern = re.compile(pattern, flags)
+        self._groups = {f"k{i}": keyword for i, keyword in enumerate(combined)}
+        self._separate = [(keyword, re.compile(keyword, flags)) for keyword in self.keywords if not combinable(keyword)]
+        self.stats = {"pages": 0, "pages_tagged": 0, "hits": Counter()}
+
+    def tag(self, contents: List[str]) -> Tuple[List[int], List[List[str]]]:
+        """Number of keyword hits and the matched keywords (most hits first) of every content"""
+        hits, matched = [], []
+        for content in contents:
+            counts = Counter(self._groups[match.lastgroup] for match in self._pattern.finditer(content))
+            for keyword, pattern in self._separate:
+                count = sum(1 for _ in pattern.finditer(content))
+                if count:
+                    counts[keyword] += count
+            hits.append(sum(counts.values()))
+            matched.append([keyword for keyword, _ in counts.most_common()])
+            self.stats["hits"].update(counts)
+        self.stats["pages"] += len(contents)
+        self.stats["pages_tagged"] += sum(1 for count in hits if count)
+        return hits, matched
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, hits=dict(self.stats["hits"].most_common()))
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    tagger = KeywordTagger(keywords=["vacatures?", "werken.bij", "solliciteer"])
+    pages = ["Werken bij het CBS\nVacature: data scientist\nSolliciteer direct", "Nieuws over de economie"]
+    print(tagger.tag(pages))
+    print(tagger.get_stats())
@@ -1 +1,4 @@
-from parse.HTML import IHTMLParser, HTMLBodyParser, EmptystringParser
\ No newline at end of file
+from parse.HTML import IHTMLParser, HTMLBodyParser, EmptystringParser
+from parse.Links import ILinkExtractor, LxmlLinkExtractor, SoupLinkExtractor, LinkResolver
+from parse.Boilerplate import BoilerplateFilter
+from parse.Tagger import KeywordTagger, combinable
@@ -0,0 +1,257 @@
+from typing import Dict, Iterator, List, Optional
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+
+class JobTable(object):
+    """
+    Shared table of base-urls for scraping with several workers, on one or more machines
+    Workers claim small batches of base-urls with a lease, extend their leases with a heartbeat
+    while they work, and mark base-urls done once their output is saved. Leases of workers that
+    died expire and are claimed again by the others. Any database supported by SQLAlchemy works,
+    e.g. an SQLite file on a shared volume.
+    """
+    TODO = "todo"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+    def __init__(
+            self,
+            url: str,
+            lease_seconds: float = 900,
+            batch_size: int = 5,
+            max_attempts: int = 3,
+            wait_for_leases: bool = True,
+            worker_id: Optional[str] = None):
+        """
+        :param url: SQLAlchemy database url, e.g. sqlite:////shared/jobs.sqlite
+        :param lease_seconds: Time after which base-urls of a worker without heartbeat are claimed by others
+        :param batch_size: Number of base-urls claimed at once
+        :param max_attempts: Base-urls that were claimed this often without being done are marked failed
+        :param wait_for_leases: When nothing is left to claim, wait for leases of other workers to be done or expire
+        :param worker_id: Name of this worker in the table, defaults to host and process id
+        """
+        from sqlalchemy import Column, Float, Integer, MetaData, String, Table, create_engine  # lazy import
+        from sqlalchemy.exc import OperationalError, ProgrammingError
+
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        logging.info(f"Initializing JobTable at {url} as worker {self.worker_id}")
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.wait_for_leases = wait_for_leases
+
+        connect_args = {"timeout": 60} if url.startswith("sqlite") else {}  # wait for locks of other workers
+        self._engine = create_engine(url, connect_args=connect_args)
+        metadata = MetaData()
+        self._jobs = Table(
+            "jobs", metadata,
+            Column("id", Integer, primary_key=True),  # position in the list of base-urls
+            Column("base_url", String(2048), nullable=False, unique=True),
+            Column("status", String(8), nullable=False, index=True),
+            Column("worker", String(128)),
+            Column("lease_until", Float),
+            Column("attempts", Integer, nullable=False, default=0),
+            Column("updated_at", Float))
+        try:
+            metadata.create_all(self._engine)
+        except (OperationalError, ProgrammingError):
+            metadata.create_all(self._engine)  # another worker created the table at the same time
+
+        self._leased = set()  # base-urls leased by this worker and not yet done
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat = None
+        self.stats = {"claimed": 0, "done": 0, "released": 0, "reclaimed": 0}
+
+    def seed(self, base_urls: List[str]) -> int:
+        """Add base-urls that are not in the table yet, safe to call from every worker, returns the number added"""
+        from sqlalchemy import func, insert, select  # lazy import
+        from sqlalchemy.exc import IntegrityError
+
+        for _ in range(3):
+            try:
+                with self._engine.begin() as connection:
+                    known = set(connection.execute(select(self._jobs.c.base_url)).scalars())
+                    next_id = connection.execute(select(func.coalesce(func.max(self._jobs.c.id), -1))).scalar() + 1
+                    new = [base_url for base_url in dict.fromkeys(base_urls) if base_url not in known]
+                    if new:
+                        connection.execute(insert(self._jobs), [
+                            {"id": next_id + i, "base_url": base_url, "status": self.TODO, "attempts": 0, "updated_at": time.time()}
+                            for i, base_url in enumerate(new)])
+                logging.info(f"Seeded job table with {len(new)} new base-urls, {len(base_urls) - len(new)} were already known")
+                return len(new)
+            except IntegrityError:
+                # another worker seeded at the same time, what is left is seeded in the next attempt
+                logging.info("Job table was seeded by another worker at the same time, trying again")
+        return 0
+
+    def _reclaim(self, connection, now: float):
+        """Leases that expired go back to todo, or to failed after max_attempts"""
+        from sqlalchemy import update  # lazy import
+
+        expired = (self._jobs.c.status == self.LEASED) & (self._jobs.c.lease_until < now)
+        failed = connection.execute(
+            update(self._jobs).where(expired & (self._jobs.c.attempts >= self.max_attempts))
+            .values(status=self.FAILED, worker=None, lease_until=None, updated_at=now)).rowcount
+        reclaimed = connection.execute(
+            update(self._jobs).where(expired)
+            .values(status=self.TODO, worker=None, lease_until=None, updated_at=now)).rowcount
+        if reclaimed or failed:
+            logging.info(f"Reclaimed {reclaimed} base-urls with expired leases, {failed} failed too often")
+            self.stats["reclaimed"] += reclaimed
+
+    def claim(self) -> Optional[List[str]]:
+        """
+        Lease the next batch of base-urls, returns None if there is nothing to claim right now
+        An empty list means other workers leased the batch first, there may be more to claim.
+        """
+        from sqlalchemy import select, update  # lazy import
+
+        now = time.time()
+        with self._engine.begin() as connection:
+            self._reclaim(connection=connection, now=now)
+            ids = list(connection.execute(
+                select(self._jobs.c.id).where(self._jobs.c.status == self.TODO)
+                .order_by(self._jobs.c.id).limit(self.batch_size)).scalars())
+            if not ids:
+                return None
+            # only rows that are still todo are leased, so two workers never get the same base-url
+            connection.execute(
+                update(self._jobs).where(self._jobs.c.id.in_(ids) & (self._jobs.c.status == self.TODO))
+                .values(status=self.LEASED, worker=self.worker_id, lease_until=now + self.lease_seconds,
+                        attempts=self._jobs.c.attempts + 1, updated_at=now))
+            claimed = list(connection.execute(
+                select(self._jobs.c.base_url).where(
+                    self._jobs.c.id.in_(ids) & (self._jobs.c.status == self.LEASED) & (self._jobs.c.worker == self.worker_id))
+                .order_by(self._jobs.c.id)).scalars())
+
+        with self._lock:
+            self._leased.update(claimed)
+        self.stats["claimed"] += len(claimed)
+        logging.info(f"Claimed {len(claimed)} base-urls from the job table")
+        return claimed
+
+    def done(self, base_urls: List[str]):
+        """Mark base-urls done, their output must be saved already"""
+        self._finish(base_urls=base_urls, status=self.DONE)
+        self.stats["done"] += len(base_urls)
+
+    def release(self, base_urls: List[str]):
+        """Give base-urls back, e.g. after an error, they are claimed again until max_attempts"""
+        self._finish(base_urls=base_urls, status=self.TODO)
+        self.stats["released"] += len(base_urls)
+
+    def _finish(self, base_urls: List[str], status: str):
+        from sqlalchemy import update  # lazy import
+
+        if not base_urls:
+            return
+        values = dict(worker=None, lease_until=None, updated_at=time.time())
+        mine = self._jobs.c.base_url.in_(base_urls) & (self._jobs.c.worker == self.worker_id)
+        with self._engine.begin() as connection:
+            if status == self.TODO:
+                # released too often, probably the base-url itself makes the scrape fail
+                connection.execute(
+                    update(self._jobs).where(mine & (self._jobs.c.attempts >= self.max_attempts))
+                    .values(status=self.FAILED, **values))
+            connection.execute(update(self._jobs).where(mine).values(status=status, **values))
+        with self._lock:
+            self._leased.difference_update(base_urls)
+
+    def renew(self) -> int:
+        """Extend the leases of all base-urls this worker still holds, returns the number of leases renewed"""
+        from sqlalchemy import update  # lazy import
+
+        with self._lock:
+            leased = list(self._leased)
+        if not leased:
+            return 0
+        now = time.time()
+        with self._engine.begin() as connection:
+            renewed = connection.execute(
+                update(self._jobs).where(
+                    self._jobs.c.base_url.in_(leased) & (self._jobs.c.worker == self.worker_id)
+                    & (self._jobs.c.status == self.LEASED))
+                .values(lease_until=now + self.lease_seconds, updated_at=now)).rowcount
+        if renewed < len(leased):
+            logging.warning(f"Lost the lease on {len(leased) - renewed} base-urls, they may be scraped twice")
+        return renewed
+
+    def _beat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                self.renew()
+            except Exception as e:
+                logging.warning(f"Heartbeat to the job table failed. Error: {e}")
+
+    def start_heartbeat(self):
+        self._stop.clear()
+        self._heartbeat = threading.Thread(target=self._beat, name="job-heartbeat", daemon=True)
+        self._heartbeat.start()
+
+    def stop_heartbeat(self):
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+
+    def counts(self) -> Dict[str, int]:
+        """Number of base-urls per status"""
+        from sqlalchemy import func, select  # lazy import
+
+        with self._engine.connect() as connection:
+            rows = connection.execute(select(self._jobs.c.status, func.count()).group_by(self._jobs.c.status))
+            return {status: count for status, count in rows}
+
+    def leased_by_others(self) -> int:
+        """Number of base-urls currently leased by other workers"""
+        from sqlalchemy import func, select  # lazy import
+
+        with self._engine.connect() as connection:
+            return connection.execute(
+                select(func.count()).select_from(self._jobs)
+                .where((self._jobs.c.status == self.LEASED) & (self._jobs.c.worker != self.worker_id))).scalar()
+
+    def claims(self) -> Iterator[str]:
+        """
+        Base-urls claimed batch by batch, until no base-url is left to do
+        With wait_for_leases, the worker waits while other workers still hold leases, to take over the ones that expire.
+        """
+        while True:
+            batch = self.claim()
+            if batch is not None:
+                yield from batch  # an empty batch was lost to another worker, claim again right away
+                continue
+            if not self.wait_for_leases or self.leased_by_others() == 0:
+                logging.info(f"No base-urls left in the job table: {self.counts()}")
+                return
+            logging.info(f"Waiting for leases of other workers to be done or to expire: {self.counts()}")
+            time.sleep(min(60., self.lease_seconds / 3))
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats)
+
+
+if __name__ == "__main__":
+
+    import tempfile
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        url = f"sqlite:///{dir_tmp}/jobs.sqlite"
+        workers = [JobTable(url=url, lease_seconds=1, batch_size=2, worker_id=f"worker{i}") for i in range(2)]
+        workers[0].seed([f"https://example{i}.nl" for i in range(5)])
+        workers[1].seed([f"https://example{i}.nl" for i in range(7)])
+
+        print("worker0", workers[0].claim())  # worker0 dies after claiming, its lease expires
+        for base_url in workers[1].claims():
+            print("worker1", base_url)
+            workers[1].done([base_url])
+        print(workers[1].counts())
@@ -0,0 +1,100 @@
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+import logging
+import queue
+import threading
+
+
+_DONE = object()  # put on a queue after the last item
+
+
+class Pipeline(object):
+    """
+    Staged producer/consumer pipeline
+    Every stage runs in its own thread and hands its output to the next stage through a bounded queue,
+    so different items can be in different stages at the same time. The first stage pulls its
+    items from the source, the output of the last stage is discarded.
+    A stage that returns None drops the item, a stage that raises is logged and also drops the item.
+    Dropped items are handed to on_drop, if given.
+    With threaded=False all stages are run one after the other for each item, in the calling thread.
+    """
+    def __init__(
+            self,
+            source: Iterable,
+            stages: List[Tuple[str, Callable]],
+            queue_size: int = 2,
+            threaded: bool = True,
+            on_drop: Optional[Callable] = None):
+        """
+        :param source: Items that go into the first stage
+        :param stages: List of (name, function) pairs, each function takes an item and returns an item
+        :param queue_size: Maximum number of items waiting in front of each stage after the first
+        :param threaded: False to run all stages sequentially in the calling thread
+        :param on_drop: Called with the input item of a stage that dropped it
+        """
+        self._source = source
+        self._stages = stages
+        self._threaded = threaded
+        self._on_drop = on_drop
+        self._queues = {name: queue.Queue(maxsize=queue_size) for name, _ in stages[1:]}
+        logging.info(f"Initializing {'threaded' if threaded else 'sequential'} pipeline with stages: {', '.join(name for name, _ in stages)}")
+
+    def get_queue_depths(self) -> Dict[str, int]:
+        """Number of items waiting in front of each stage"""
+        return {name: q.qsize() for name, q in self._queues.items()}
+
+    def _process(self, name: str, function: Callable, item):
+        try:
+            result = function(item)
+        except Exception as e:
+            logging.exception(f"Pipeline stage {name} failed, item is dropped. Error: {e}")
+            result = None
+        if result is None and self._on_drop is not None:
+            self._on_drop(item)
+        return result
+
+    def _run_stage(self, index: int):
+        name, function = self._stages[index]
+        q_out = self._queues[self._stages[index + 1][0]] if index + 1 < len(self._stages) else None
+
+        items = self._source if index == 0 else iter(self._queues[name].get, _DONE)
+        try:
+            for item in items:
+                item = self._process(name=name, function=function, item=item)
+                if item is not None and q_out is not None:
+                    q_out.put(item)  # blocks while the next stage is behind
+        finally:
+            # also when the source fails, so that the next stages do not wait forever
+            if q_out is not None:
+                q_out.put(_DONE)
+            logging.debug(f"Pipeline stage {name} finished")
+
+    def run(self):
+        """Process all items from the source, returns when the last stage has finished"""
+        if not self._threaded:
+            for item in self._source:
+                for name, function in self._stages:
+                    item = self._process(name=name, function=function, item=item)
+                    if item is None:
+                        break
+            return
+
+        threads = [
+            threading.Thread(target=self._run_stage, args=(index, ), name=f"stage-{name}", daemon=True)
+            for index, (name, _) in enumerate(self._stages)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+
+class SiteJob(object):
+    """
+    Unit of work in the scrape pipeline: everything known about a single base-url
+    """
+    def __init__(self, base_url: str, results: List, html: Dict[str, str], delay: float, stats: Optional[Dict] = None):
+        self.base_url = base_url
+        self.results = results  # CrawlResults of targeted urls
+        self.html = html  # {url: html} of results, filled by crawl and fetch stages
+        self.delay = delay  # crawl delay for fetching results that were not visited during the crawl
+        self.stats = stats or dict()
+        self.records = []  # rows for output, filled by the parse stage
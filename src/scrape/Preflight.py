@@ -0,0 +1,177 @@
+from typing import Callable, Dict, Iterator, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+import csv
+import logging
+import os
+import re
+import time
+
+from fetch import DNSCache
+
+
+class LivenessChecker(object):
+    """
+    Pre-flight check of base-urls, run concurrently before the scrape
+    For every base-url: does the domain resolve, is the start page allowed and does it return html,
+    where do redirects end, and is the html more than an empty or parked page.
+    Results are cached in a csv table, so that later runs and other shards can reuse them.
+    """
+    _parked = re.compile(
+        r"domain (name )?(is|may be) for sale|buy this domain|parked (free|domain)|sedoparking|"
+        r"dit domein is te koop|domeinnaam is geregistreerd|this domain has been registered|coming soon",
+        re.IGNORECASE)
+    _fields = ["base_url", "start_url", "alive", "reason", "status", "final_url", "html_bytes", "checked_at"]
+
+    def __init__(
+            self,
+            dnscache: DNSCache,
+            user_agent: str,
+            timeout: tuple = (3, 7),
+            max_workers: int = 32,
+            min_html_bytes: int = 512,
+            sample_bytes: int = 65536,
+            is_allowed: Optional[Callable[[str], bool]] = None):
+        """
+        :param dnscache: Shared DNS cache, dead domains fail without a request
+        :param user_agent: User agent for the start page requests
+        :param timeout: Connect and read timeout in seconds
+        :param max_workers: Number of base-urls checked at the same time
+        :param min_html_bytes: Start pages with less html are considered empty
+        :param sample_bytes: Only this much of the start page is downloaded
+        :param is_allowed: Robots check, start pages that are not allowed are not requested
+        """
+        logging.info(f"Initializing LivenessChecker with {max_workers} workers")
+        self._dnscache = dnscache
+        self._headers = {"User-Agent": user_agent, "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.8"}
+        self._timeout = timeout
+        self._max_workers = max_workers
+        self._min_html_bytes = min_html_bytes
+        self._sample_bytes = sample_bytes
+        self._is_allowed = is_allowed
+
+    def check(self, base_url: str) -> Dict:
+        """Check a single base-url, returns a row for the liveness table"""
+        import requests  # lazy import
+
+        start_url = base_url if base_url.startswith(('https://', 'http://')) else f"https://{base_url}"
+        row = {"base_url": base_url, "start_url": start_url, "alive": False, "reason": "", "status": "",
+               "final_url": "", "html_bytes": 0, "checked_at": int(time.time())}
+
+        if not self._dnscache.resolve(urlsplit(start_url).hostname):
+            row["reason"] = "dns"
+            return row
+        if self._is_allowed is not None and not self._is_allowed(start_url):
+            row["reason"] = "robots"
+            return row
+
+        try:
+            with requests.get(start_url, headers=self._headers, timeout=self._timeout, stream=True) as response:
+                row["status"] = response.status_code
+                row["final_url"] = response.url
+                if response.status_code != 200:
+                    row["reason"] = "status"
+                    return row
+                if "text/html" not in response.headers.get("Content-Type", ""):
+                    row["reason"] = "not_html"
+                    return row
+
+                body = b""
+                for chunk in response.iter_content(chunk_size=16384):
+                    body += chunk
+                    if len(body) >= self._sample_bytes:
+                        break
+        except requests.exceptions.RequestException as e:
+            logging.debug(f"Pre-flight request failed for {start_url}. Error: {e}")
+            row["reason"] = "error"
+            return row
+
+        row["html_bytes"] = len(body)
+        if len(body) < self._min_html_bytes:
+            row["reason"] = "empty"
+        elif self._parked.search(body.decode("utf-8", errors="replace")):
+            row["reason"] = "parked"
+        else:
+            row["alive"] = True
+        return row
+
+    def check_all(self, base_urls: List[str]) -> List[Dict]:
+        """Check base-urls concurrently, returns rows in the order of base_urls"""
+        time_start = time.time()
+        with ThreadPoolExecutor(max_workers=self._max_workers, thread_name_prefix="preflight") as executor:
+            rows = list(executor.map(self.check, base_urls))
+        logging.info(f"Pre-flight check of {len(base_urls)} base-urls took {int(round(time.time() - time_start, 0))} seconds")
+        return rows
+
+    def load_table(self, path: str, max_age: float) -> Dict[str, Dict]:
+        """Rows of the cached liveness table that are younger than max_age seconds, by base-url"""
+        if not os.path.exists(path):
+            return dict()
+        with open(path, 'r', encoding='utf-8', newline='') as file_in:
+            rows = {row["base_url"]: row for row in csv.DictReader(file_in)}
+        for row in rows.values():
+            row["alive"] = row["alive"] == "True"
+            row["checked_at"] = int(row["checked_at"] or 0)
+        return {base_url: row for base_url, row in rows.items() if time.time() - row["checked_at"] < max_age}
+
+    def save_table(self, path: str, rows: List[Dict]):
+        """
+        Merge rows into the liveness table, written to a temporary file first so readers never see half a table
+        The merge holds a lock file, so that workers saving at the same time do not overwrite each other's rows.
+        """
+        with self._locked(path):
+            table = dict()
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8', newline='') as file_in:
+                    table = {row["base_url"]: row for row in csv.DictReader(file_in)}
+            table.update({row["base_url"]: row for row in rows})
+
+            path_tmp = f"{path}.{os.getpid()}.tmp"
+            with open(path_tmp, 'w', encoding='utf-8', newline='') as file_out:
+                writer = csv.DictWriter(file_out, fieldnames=self._fields)
+                writer.writeheader()
+                writer.writerows(table.values())
+            os.replace(path_tmp, path)
+
+    @staticmethod
+    @contextmanager
+    def _locked(path: str, stale_after: float = 300) -> Iterator[None]:
+        """Hold {path}.lock, created exclusively so it also works on shared volumes. Locks older than stale_after are broken"""
+        path_lock = f"{path}.lock"
+        while True:
+            try:
+                os.close(os.open(path_lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path_lock) > stale_after:
+                        logging.warning(f"Breaking lock {path_lock}, its owner did not release it within {stale_after} seconds")
+                        os.remove(path_lock)
+                        continue
+                except OSError:
+                    continue  # released in the meantime
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            os.remove(path_lock)
+
+    def run(self, base_urls: List[str], path: str, max_age: float) -> List[Dict]:
+        """Rows for all base_urls, from the cached table where possible, new checks are added to the table"""
+        cached = self.load_table(path=path, max_age=max_age)
+        todo = [base_url for base_url in base_urls if base_url not in cached]
+        logging.info(f"Pre-flight: {len(base_urls) - len(todo)} base-urls found in liveness table {path}, {len(todo)} to check")
+
+        checked = {row["base_url"]: row for row in self.check_all(todo)} if todo else dict()
+        if checked:
+            self.save_table(path=path, rows=list(checked.values()))
+        return [cached.get(base_url) or checked[base_url] for base_url in base_urls]
+
+
+def site_key(url: str) -> str:
+    """Key to recognise base-urls that end up at the same site: host without www, and path"""
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    host = host[4:] if host.startswith("www.") else host
+    return f"{host}{parts.path.rstrip('/')}"
@@ -1,39 +1,91 @@
 import logging
-from scrape.base import IScraper, Scraper
-from util import setup
+from typing import Optional
+
+from omegaconf import DictConfig
 
-CONFIG = setup("../config/config.yaml")
+from util import InputSource
+from scrape.base import IScraper, Scraper
+from scrape.Preflight import LivenessChecker
+from scrape.Jobs import JobTable
 
 
-def build_webfocusedscraper(user_agent: str) -> IScraper:
+def build_webfocusedscraper(config: DictConfig, user_agent: Optional[str] = None) -> IScraper:
     """
     Build Scraper class with standard settings
+    The same config object is passed on to all components
     """
     from crawl import HesitantCrawler
-    from fetch import HTMLFetcher
-    from parse import HTMLBodyParser
+    from fetch import HTMLFetcher, ReplayFetcher
+    from parse import BoilerplateFilter, HTMLBodyParser, KeywordTagger, LxmlLinkExtractor, SoupLinkExtractor
 
-    with open(f"{CONFIG.input.input_dir}/{CONFIG.input.input_files.keywords}", 'r', encoding='utf-8') as file_in:
-        target_keywords = [line.rstrip() for line in file_in]
+    user_agent = user_agent or config.requests.useragent
 
-    fetcher = HTMLFetcher(user_agent=user_agent)
+    file_keywords = f"{config.input.input_dir}/{config.input.input_files.keywords}"
+    target_keywords = list(InputSource(path=file_keywords, column=config.input.keyword_column, index=False).read())
+
+    # Replaying archived responses needs no network, so no sitemaps, pre-flight check or crawl delay
+    replay = config.warc.replay
+    if replay:
+        fetcher = ReplayFetcher(warc_dir=config.warc.dir, return_bytes=config.requests.return_bytes)
+    else:
+        fetcher = HTMLFetcher(config=config, user_agent=user_agent)
+        if config.dns.install:
+            fetcher.dnscache.install()  # all lookups of this process, also of requests and usp, go through the cache
+    link_extractor = SoupLinkExtractor() if config.crawl.link_extractor == "bs4" else LxmlLinkExtractor()
     crawler = HesitantCrawler(
         fetcher=fetcher,
         target_keywords=target_keywords,
-        add_sitemapurls=CONFIG.crawl.use_sitemap,
-        max_depth=CONFIG.crawl.max_depth)
+        config=config,
+        add_sitemapurls=config.crawl.use_sitemap and not replay,
+        max_depth=config.crawl.max_depth,
+        link_extractor=link_extractor)
+    if replay:
+        crawler.crawl_delay = 0
     htmlparser = HTMLBodyParser()
 
+    preflight = None
+    if config.preflight.enabled and not replay:
+        preflight = LivenessChecker(
+            dnscache=fetcher.dnscache,
+            user_agent=user_agent,
+            timeout=fetcher.timeout,
+            max_workers=config.preflight.workers,
+            min_html_bytes=config.preflight.min_html_bytes,
+            is_allowed=fetcher.is_allowed)
+
+    jobs = None
+    if config.jobs.enabled:
+        jobs = JobTable(
+            url=config.jobs.url,
+            lease_seconds=config.jobs.lease,
+            batch_size=config.jobs.batch,
+            max_attempts=config.jobs.max_attempts,
+            wait_for_leases=config.jobs.wait_for_leases)
+
+    boilerplate = None
+    if config.boilerplate.enabled:
+        boilerplate = BoilerplateFilter(max_share=config.boilerplate.max_share, min_pages=config.boilerplate.min_pages)
+
+    tagger = None
+    if config.tagging.enabled:
+        tagger = KeywordTagger(keywords=target_keywords + list(config.tagging.keywords), case_sensitive=config.tagging.case_sensitive)
+
     return Scraper(
-        crawler=crawler, 
-        fetcher=fetcher, 
-        htmlparser=htmlparser)
+        crawler=crawler,
+        fetcher=fetcher,
+        htmlparser=htmlparser,
+        config=config,
+        preflight=preflight,
+        jobs=jobs,
+        boilerplate=boilerplate,
+        tagger=tagger)
 
 
 if __name__ == "__main__":
-    
+    from util import setup
+
     logging.basicConfig(level=logging.DEBUG)
 
-    user_agent = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
-    scraper = build_webfocusedscraper(user_agent=user_agent)
+    config = setup("../config/config.yaml")
+    scraper = build_webfocusedscraper(config=config)
     scraper.scrape()
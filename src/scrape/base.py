@@ -1,18 +1,20 @@
 import logging
 import os
+import json
 from abc import ABC, abstractmethod
-import pandas as pd
-import numpy as np
-from typing import List
+from typing import List, Dict, Tuple, Optional
 from datetime import datetime
 import time
 
-from util import setup
-from fetch import IFetcher
-from crawl import ICrawler
-from parse import IHTMLParser
+from omegaconf import DictConfig
 
-CONFIG = setup("../config/config.yaml")
+from fetch import IFetcher, ReplayFetcher
+from crawl import ICrawler
+from parse import IHTMLParser, BoilerplateFilter, KeywordTagger
+from util import MemoryMonitor, SamplingProfiler, current_rss, sizeof_values, release_memory, read_urls
+from .Jobs import JobTable
+from .Pipeline import Pipeline, SiteJob
+from .Preflight import LivenessChecker, site_key
 
 
 class IScraper(ABC):
@@ -30,6 +32,10 @@ class IScraper(ABC):
     def save_batch(self, batch: List, batch_id: int):
         raise NotImplementedError()
 
+    @abstractmethod
+    def save_stats(self, stats: Dict):
+        raise NotImplementedError()
+
     @abstractmethod
     def scrape(self):
         raise NotImplementedError()
@@ -39,112 +45,430 @@ class Scraper(IScraper):
     """
     Interface for all Scrapers
     """
-    def __init__(self, crawler: ICrawler, fetcher: IFetcher, htmlparser: IHTMLParser):
+    def __init__(
+            self,
+            crawler: ICrawler,
+            fetcher: IFetcher,
+            htmlparser: IHTMLParser,
+            config: DictConfig,
+            preflight: Optional[LivenessChecker] = None,
+            jobs: Optional[JobTable] = None,
+            boilerplate: Optional[BoilerplateFilter] = None,
+            tagger: Optional[KeywordTagger] = None):
         super(Scraper, self).__init__(crawler=crawler, fetcher=fetcher, htmlparser=htmlparser)
-        
-        # All scrapers take base-url input from file
-        file_urls = f"{CONFIG.input.input_dir}/{CONFIG.input.input_files.urls}"
-        logging.info(f"Reading list of base-urls from file: {file_urls}")
-        logging.info(f"Offset is set to {CONFIG.input.url_offset} and maximum number of base-urls is {CONFIG.input.url_max}")
-        with open(file_urls, 'r', encoding='utf-8') as file_in:
-            self._base_urls = [line.rstrip() for line in file_in]
-        self._base_urls = self._base_urls[CONFIG.input.url_offset:CONFIG.input.url_offset + CONFIG.input.url_max]
-        logging.debug(f"Read list with {len(self._base_urls)} base-urls from file: {file_urls}")
-        logging.debug(f"Scraper will start with entry {CONFIG.input.url_offset + 1} in the file")
+        self._config = config
+        self._boilerplate = boilerplate  # removes lines that repeat on many pages of a base-url
+        self._tagger = tagger  # counts target keywords in the content of pages
+
+        # With a job table, base-urls are claimed from the table instead, so that several workers can share them
+        self._jobs = jobs
+        self._unsaved = []  # base-urls with records in the buffer, they are done once the buffer is saved
+        self._base_urls = []
+        self._start_urls = dict()  # {base_url: url to start the crawl from}
+        if jobs is None or config.jobs.seed:
+            # All scrapers take base-url input from file
+            file_urls = f"{config.input.input_dir}/{config.input.input_files.urls}"
+            logging.info(f"Reading list of base-urls from file: {file_urls}")
+            logging.info(f"Offset is set to {config.input.url_offset} and maximum number of base-urls is {config.input.url_max}")
+            # Streamed from the offset on, so that a shard of a very large file does not read all lines before it
+            self._base_urls = list(read_urls(
+                path=file_urls,
+                offset=config.input.url_offset,
+                limit=config.input.url_max,
+                column=config.input.url_column,
+                index=config.input.index))
+            logging.debug(f"Read list with {len(self._base_urls)} base-urls from file: {file_urls}")
+            logging.debug(f"Scraper will start with entry {config.input.url_offset + 1} in the file")
+
+            # Pre-flight check: skip or postpone dead base-urls, and crawl base-urls that redirect to the same site once
+            if preflight is not None:
+                self._base_urls = self._apply_preflight(preflight=preflight)
+            if jobs is not None:
+                jobs.seed(self._base_urls)
+        elif preflight is not None and config.preflight.use_final_url:
+            # workers that do not seed only read where to start from the liveness table of the seeding worker
+            self._start_urls = self._cached_start_urls(preflight=preflight)
+
+        # RSS is sampled per base-url, above the soft limit the output is flushed early and caches are emptied
+        self._memory = MemoryMonitor(
+            soft_limit=config.memory.soft_limit * 2 ** 20,
+            sample_interval=config.memory.sample_interval,
+            tracemalloc_top=config.memory.tracemalloc_top)
 
         # create output folder with current datetime and possible url offset
-        self._dir_out = f"{CONFIG.output.output_dir}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_offset{CONFIG.input.url_offset}"
+        self._dir_out = f"{config.output.output_dir}/{datetime.now().strftime('%Y%m%d_%H%M%S')}_offset{config.input.url_offset}"
+        if jobs is not None:
+            self._dir_out += f"_{jobs.worker_id}"  # workers on a shared volume each write their own dataset
         logging.info(f"Creating output folder: {self._dir_out}")
         os.makedirs(self._dir_out, exist_ok=True)
         logging.debug("Created output folder")
+
+        # Sampled stacks per base-url in the output folder, to see where the time of a slow run goes
+        self._profiler = None
+        if config.profile.enabled:
+            self._profiler = SamplingProfiler(
+                dir_out=f"{self._dir_out}/{config.profile.dir}",
+                interval=config.profile.interval,
+                sample_share=config.profile.sample_share,
+                top=config.profile.top)
         # TODO instead consider a given folder name and crash-robust resuming of batch iteration
 
+    def _apply_preflight(self, preflight: LivenessChecker) -> List[str]:
+        """Order base-urls by liveness, returns the base-urls to scrape"""
+        rows = preflight.run(
+            base_urls=self._base_urls,
+            path=self._config.preflight.table,
+            max_age=self._config.preflight.max_age * 3600)
+
+        alive, dead, seen = [], [], dict()
+        for row in rows:
+            base_url = row["base_url"]
+            if not row["alive"]:
+                logging.debug(f"Pre-flight found base url {base_url} not alive, reason: {row['reason']}")
+                dead.append(base_url)
+                continue
+
+            key = site_key(row["final_url"] or row["start_url"])
+            if key in seen:
+                logging.info(f"Base url {base_url} ends up at the same site as {seen[key]}, it will not be crawled twice")
+                continue
+            seen[key] = base_url
+            alive.append(base_url)
+            if self._config.preflight.use_final_url and row["final_url"]:
+                self._start_urls[base_url] = row["final_url"]
+
+        logging.info(f"Pre-flight: {len(alive)} base-urls alive, {len(dead)} not alive, {len(rows) - len(alive) - len(dead)} duplicate sites")
+        if self._config.preflight.skip_dead:
+            return alive
+        return alive + dead
+
+    def _cached_start_urls(self, preflight: LivenessChecker) -> Dict[str, str]:
+        """Start urls of base-urls that redirect, from the liveness table as it is, no base-url is checked"""
+        rows = preflight.load_table(path=self._config.preflight.table, max_age=self._config.preflight.max_age * 3600)
+        start_urls = {base_url: row["final_url"] for base_url, row in rows.items() if row["alive"] and row["final_url"]}
+        logging.info(f"Pre-flight: start urls of {len(start_urls)} base-urls read from liveness table {self._config.preflight.table}")
+        return start_urls
+
     def save_batch(self, batch: List, batch_id: int):
+        import pandas as pd
+
         df = pd.DataFrame(batch)
 
         # add partition column
         df["batch"] = batch_id
 
+        # keyword lists are typed explicitly, a batch without any hit would otherwise get a list of nulls
+        schema = None
+        if "keywords_matched" in df.columns:
+            import pyarrow as pa
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            schema = schema.set(schema.get_field_index("keywords_matched"), pa.field("keywords_matched", pa.list_(pa.string())))
+
         df.to_parquet(
             self._dir_out,
             engine="pyarrow",
             partition_cols=["batch"],
             index=False,
-            compression="snappy"
+            compression="snappy",
+            schema=schema
         )
 
+    def save_stats(self, stats: Dict):
+        """Append statistics of a single base-url as a json line, the leading underscore keeps it out of the parquet dataset"""
+        with open(f"{self._dir_out}/_crawlstats.jsonl", 'a', encoding='utf-8') as file_out:
+            file_out.write(json.dumps(stats, default=str) + "\n")
+
+    def get_queue_depths(self) -> Dict[str, int]:
+        """Number of base-urls waiting in front of each stage of the scrape pipeline"""
+        pipeline = getattr(self, "_pipeline", None)
+        return pipeline.get_queue_depths() if pipeline is not None else {}
+
+    def _crawl_site(self, item: Tuple[int, str]) -> SiteJob:
+        """Crawl stage: find targeted urls of a base-url"""
+        cnt, base_url = item
+        if self._jobs is not None:
+            logging.info(f"Now starting scrape #{cnt + 1} of this worker, job table: {self._jobs.counts()}")
+        else:
+            logging.info(f"Now starting scrape #{cnt + 1} of {len(self._base_urls)} base-urls")
+        logging.info(f"Pipeline queue depths: {self.get_queue_depths()}")
+
+        self._memory.begin(base_url)
+
+        logging.info(f"Trying to crawl base url: {base_url}")
+        # Crawl can start as soon as start url provided
+        self._crawler.reset_with_starturl(start_url=self._start_urls.get(base_url, base_url))
+        self._crawler.crawl()
+
+        # Some urls will already have their html fetched before during crawl, don't redo this then
+        results = list(self._crawler.get_results())
+        html = {result.url: self._crawler._visited[result.url] for result in results if self._crawler._visited.get(result.url)}
+        job = SiteJob(
+            base_url=base_url,
+            results=results,
+            html=html,
+            delay=self._crawler.crawl_delay,  # might be different depending on curren domain
+            stats=dict(self._crawler.get_stats(), base_url=base_url))
+
+        # sizes of the crawl stores, measured before the crawler is reset for the next base-url
+        visited = getattr(self._crawler, "_visited", {})
+        urlstore = getattr(self._crawler, "_istargeted", None)
+        job.stats["memory"] = {
+            "visited_html_mb": round(sizeof_values(visited) / 2 ** 20, 2),
+            "urlstore_mb": round(urlstore.nbytes() / 2 ** 20, 2) if urlstore is not None else 0,
+            "urlstore_urls": len(urlstore) if urlstore is not None else 0}
+        return job
+
+    def _fetch_site(self, job: SiteJob) -> SiteJob:
+        """Fetch stage: download html of targeted urls that were not visited during the crawl"""
+        for crawlresult in job.results:
+            if crawlresult.url in job.html:
+                continue
+            logging.debug(f"Downloading html from yet unvisited url {crawlresult.url}")
+            job.html[crawlresult.url] = self._fetcher.fetch(crawlresult.url)
+
+            # Respect crawl delay if crawler dose that
+            logging.debug("Waiting for delay to pass")
+            time.sleep(job.delay)
+            logging.debug("Delay has passed")
+        return job
+
+    def _parse_site(self, job: SiteJob) -> SiteJob:
+        """Parse stage: extract content from the html of targeted urls"""
+        for crawlresult in job.results:
+            html = job.html.get(crawlresult.url)
+            content = self._htmlparser.parse(html=html) if html else ''
+            if content:
+                job.records.append({
+                    "base_url": job.base_url,
+                    "url": crawlresult.url,
+                    "first_keyword_hit": crawlresult.first_keyword_hit,
+                    "content": content
+                })
+            else:
+                logging.debug(f"After parsing no output for url {crawlresult.url}")
+        job.html = dict()  # html is no longer needed
+        return job
+
+    def _strip_site(self, job: SiteJob) -> SiteJob:
+        """Boilerplate stage: remove lines that repeat on many pages of the base-url, pages left empty are dropped"""
+        chars_before = sum(len(record["content"]) for record in job.records)
+        contents = self._boilerplate.filter([record["content"] for record in job.records])
+        records = []
+        for record, content in zip(job.records, contents):
+            if not content:
+                logging.debug(f"Content from {record['url']} is all boilerplate, not added to output")
+                continue
+            record["content"] = content
+            records.append(record)
+        job.records = records
+        job.stats["boilerplate_chars_removed"] = chars_before - sum(len(record["content"]) for record in records)
+        return job
+
+    def _dedupe_site(self, job: SiteJob) -> SiteJob:
+        """Dedupe stage: drop records with content that was already seen for the same base-url"""
+        seen_content = set()
+        records = []
+        for record in job.records:
+            if record["content"] in seen_content:  # No dupliactes
+                logging.debug(f"Content from {record['url']} is a duplicate, not added to output")
+                continue
+            seen_content.add(record["content"])
+            records.append(record)
+        job.records = records
+        return job
+
+    def _tag_site(self, job: SiteJob) -> SiteJob:
+        """Tag stage: count target keywords in the content, pages without any are dropped if configured"""
+        hits, matched = self._tagger.tag([record["content"] for record in job.records])
+        records = []
+        for record, count, keywords in zip(job.records, hits, matched):
+            if not count and self._config.tagging.drop_untagged:
+                logging.debug(f"Content from {record['url']} has no target keywords, not added to output")
+                continue
+            record["keyword_hits"] = count
+            record["keywords_matched"] = keywords
+            records.append(record)
+        job.records = records
+        job.stats["pages_untagged"] = hits.count(0)
+        return job
+
+    def _sink_site(self, job: SiteJob) -> SiteJob:
+        """Sink stage: buffer records, save them in batches, and save the stats of the base-url"""
+        for record in job.records:
+            self._buffer.append(record)
+            if len(self._buffer) >= self._config.output.batchsize:
+                self._flush_buffer()
+
+        job.stats["pages_saved"] = len(job.records)
+        job.stats["queue_depths"] = self.get_queue_depths()
+
+        # Memory of the stores that live longer than a single base-url, and the peak RSS while this base-url was in the pipeline
+        rss = current_rss()
+        peak = self._memory.end(job.base_url)
+        job.stats["memory"] = dict(
+            job.stats.get("memory", {}),
+            rss_mb=round(rss / 2 ** 20, 1) if rss is not None else None,
+            peak_rss_mb=round(peak / 2 ** 20, 1) if peak is not None else None,
+            fetcher_results_mb=round(self._fetcher.results_nbytes() / 2 ** 20, 2),
+            fetcher_results=len(self._fetcher.results),
+            buffer_records=len(self._buffer),
+            buffer_mb=round(sum(sizeof_values(record) for record in self._buffer) / 2 ** 20, 2))
+        if self._memory.tracemalloc_top:
+            job.stats["memory"]["tracemalloc_top"] = self._memory.snapshot_diff()
+
+        if self._memory.over_limit(key=job.base_url):
+            logging.warning(f"RSS of {rss // 2 ** 20} MB is over the soft limit of {self._config.memory.soft_limit} MB, flushing output early")
+            job.stats["memory"]["limit_exceeded"] = True
+            if self._buffer:
+                self._flush_buffer()
+            self._evict_caches()
+        self.save_stats(stats=job.stats)
+
+        if self._jobs is not None:
+            self._unsaved.append(job.base_url)
+            if not self._buffer:
+                self._mark_done()
+        if self._profiler is not None:
+            self._profiler.flush(job.base_url)
+        return job
+
+    def _flush_buffer(self):
+        """Save the buffered records as the next batch"""
+        self.save_batch(batch=self._buffer, batch_id=self._batch_id)
+        logging.info(f"Saved batch number {self._batch_id} with {len(self._buffer)} records")
+        self._buffer = []
+        self._batch_id += 1
+        self._mark_done()
+
+    def _mark_done(self):
+        """Base-urls whose records are all saved are done in the job table"""
+        if self._jobs is not None and self._unsaved:
+            self._jobs.done(self._unsaved)
+            self._unsaved = []
+
+    def _drop_site(self, item):
+        """A base-url failed in one of the stages, it is given back to the job table"""
+        base_url = self._base_url_of(item)
+        self._memory.end(base_url)
+        if self._jobs is not None:
+            self._jobs.release([base_url])
+        if self._profiler is not None:
+            self._profiler.flush(base_url)
+
+    @staticmethod
+    def _base_url_of(item) -> str:
+        """Base-url of the input of a pipeline stage"""
+        return item.base_url if isinstance(item, SiteJob) else item[1]
+
+    def _evict_caches(self):
+        """
+        Empty caches that are not needed for correctness, and return freed memory to the operating system
+        Only called from the sink stage, the fetcher itself locks its results against the other stages.
+        """
+        logging.info(f"Evicted {self._fetcher.evict_results()} fetched pages from the fetcher results")
+        dnscache = getattr(self._fetcher, "dnscache", None)
+        if dnscache is not None:
+            dnscache.evict_expired()
+        release_memory()
+
     def scrape(self):
+        """
+        Scrape all base-urls in a pipeline of stages: crawl, fetch, parse, boilerplate, dedupe, tag and sink
+        While one base-url is being parsed and written, the next can already be crawled.
+        """
+        time_start = time.time()
 
         # saving data in batches
-        time_start = time.time()
-        buffer = []
-        batch_id = 0
+        self._buffer = []
+        self._batch_id = 0
+
+        self._memory.start()
+        if self._jobs is not None:
+            self._jobs.start_heartbeat()
+        stages = [
+            ("crawl", self._crawl_site),
+            ("fetch", self._fetch_site),
+            ("parse", self._parse_site),
+            ("boilerplate", self._strip_site),
+            ("dedupe", self._dedupe_site),
+            ("tag", self._tag_site),
+            ("sink", self._sink_site)]
+        if self._boilerplate is None:
+            stages = [stage for stage in stages if stage[0] != "boilerplate"]
+        if self._tagger is None:
+            stages = [stage for stage in stages if stage[0] != "tag"]
+        if self._profiler is not None:
+            stages = [(name, self._profiler.attribute(function, key=self._base_url_of)) for name, function in stages]
+            self._profiler.start()
+        self._pipeline = Pipeline(
+            source=enumerate(self._jobs.claims() if self._jobs is not None else self._base_urls),
+            stages=stages,
+            queue_size=self._config.scrape.queue_size,
+            threaded=self._config.scrape.pipeline,
+            on_drop=self._drop_site)
+        self._pipeline.run()
+
+        self._memory.stop()
+        if self._profiler is not None:
+            self._profiler.stop()
 
-        for cnt, base_url in enumerate(self._base_urls):
-            logging.info(f"Now starting scrape #{cnt + 1} of {len(self._base_urls)} base-urls")
-            
-            logging.info(f"Trying to crawl base url: {base_url}")
-            # Crawl can start as soon as start url provided
-            self._crawler.reset_with_starturl(start_url=base_url)
-            self._crawler.crawl()
-
-            # track content by base_url to prevent duplicates
-            seen_content = set()
-
-            delay = self._crawler.crawl_delay  # might be different depending on curren domain
-
-            # After crawl, collect results and parse content of targeted sites
-            # Some urls will already have their html fetched before during crawl, don't redo this then
-            for crawlresult in self._crawler.get_results():
-
-                html = self._crawler._visited.get(crawlresult.url, False)
-                if not html:
-                    logging.debug(f"Downloading html from yet unvisited url {crawlresult.url}")
-                    html = self._fetcher.fetch(crawlresult.url)
-                    # Respect crawl delay if crawler dose that
-
-                    logging.debug("Waiting for delay to pass")
-                    time.sleep(delay)
-                    logging.debug("Delay has passed")
-                
-                content = self._htmlparser.parse(html=html)
-                if len(content) > 0:
-                    if content in seen_content:  # No dupliactes
-                        logging.debug(f"Content from {crawlresult.url} is a duplicate, not added to output")
-                        continue
-
-                    seen_content.add(content)
-                    buffer.append({
-                        "base_url": base_url,
-                        "url": crawlresult.url,
-                        "first_keyword_hit": crawlresult.first_keyword_hit,
-                        "content": content
-                    })
-                else:
-                    logging.debug(f"After parsing no output for url {crawlresult.url}")
-
-                if len(buffer) >= CONFIG.output.batchsize:
-                    self.save_batch(batch=buffer, batch_id=batch_id)
-                    logging.info(f"Saved batch number {batch_id} with {len(buffer)} records")
-                    buffer = []
-                    batch_id += 1
-        
         # Remaining rows at the end
-        if buffer:
-            self.save_batch(batch=buffer, batch_id=batch_id)
-            logging.info(f"Saved final batch number {batch_id} with {len(buffer)} records")
+        if self._buffer:
+            self._flush_buffer()
+        if self._jobs is not None:
+            self._mark_done()
+            self._jobs.stop_heartbeat()
+            logging.info(f"Job table: {self._jobs.counts()}, this worker: {self._jobs.get_stats()}")
 
         time_duration = (time.time() - time_start) / 60
-        logging.info(f"Finished. Running scrape took {int(np.around(time_duration, 0))} minutes.")
+        logging.info(f"Finished. Running scrape took {int(round(time_duration, 0))} minutes.")
+
+        # DNS time is reported separately from fetching
+        dnscache = getattr(self._fetcher, "dnscache", None)
+        if dnscache is not None:
+            dns_stats = dnscache.get_stats()
+            logging.info(f"DNS resolution took {int(round(dns_stats['dns_time'], 0))} seconds for {dns_stats['lookups']} lookups "
+                         f"({dns_stats['hits']} cached, {dns_stats['negative_hits']} cached failures, {dns_stats['failures']} failed)")
+
+        breaker = getattr(self._fetcher, "breaker", None)
+        if breaker is not None:
+            breaker_stats = breaker.get_stats()
+            logging.info(f"Circuit breaker skipped {breaker_stats['short_circuited']} requests, {breaker_stats['opened']} domains were skipped at some point")
+
+        warcwriter = getattr(self._fetcher, "warcwriter", None)
+        if warcwriter is not None:
+            warcwriter.close()
+            warc_stats = warcwriter.get_stats()
+            logging.info(f"Archived {warc_stats['records'] // 2} responses in {warc_stats['files']} WARC files, {warc_stats['bytes']} bytes")
+
+        replay_stats = self._fetcher.get_stats() if isinstance(self._fetcher, ReplayFetcher) else None
+        if replay_stats is not None:
+            logging.info(f"Replay served {replay_stats['hits']} urls from the archive, {replay_stats['misses']} urls were not archived")
+
+        if self._boilerplate is not None:
+            boilerplate_stats = self._boilerplate.get_stats()
+            logging.info(f"Boilerplate removal shrank content from {boilerplate_stats['chars_before']} to {boilerplate_stats['chars_after']} "
+                         f"characters on {boilerplate_stats['sites']} base-urls, {boilerplate_stats['lines_removed']} lines removed")
+
+        if self._tagger is not None:
+            tagger_stats = self._tagger.get_stats()
+            logging.info(f"Target keywords found in the content of {tagger_stats['pages_tagged']} of {tagger_stats['pages']} pages, "
+                         f"hits per keyword: {tagger_stats['hits']}")
+
+        memory_stats = self._memory.get_stats()
+        if memory_stats["peak_rss_process"] is not None:
+            logging.info(f"Peak RSS was {memory_stats['peak_rss_process'] // 2 ** 20} MB, the soft memory limit was exceeded for {memory_stats['limit_exceeded']} base-urls")
 
 
 if __name__ == "__main__":
     from crawl import NoCrawler
     from fetch import NoFetcher
     from parse import EmptystringParser
+    from util import setup
 
     logging.basicConfig(level=logging.DEBUG)
 
+    config = setup("../config/config.yaml")
     fetcher = NoFetcher()
     crawler = NoCrawler()
     htmlparser = EmptystringParser()
@@ -152,5 +476,6 @@ if __name__ == "__main__":
     scraper = Scraper(
         crawler=crawler, 
         fetcher=fetcher, 
-        htmlparser=htmlparser)
+        htmlparser=htmlparser,
+        config=config)
     scraper.scrape()
@@ -1 +1,5 @@
-from .setup import setup
\ No newline at end of file
+from .setup import setup
+from .encoding import sniff_encoding, decode_html, HTMLBytes
+from .memory import MemoryMonitor, current_rss, sizeof_values, release_memory
+from .source import InputSource, read_urls, normalise_url, open_text
+from .profiler import SamplingProfiler
@@ -0,0 +1,78 @@
+from typing import Optional
+import codecs
+import logging
+import re
+
+
+_BOMS = (
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"))
+_CHARSET_HEADER = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_CHARSET_META = re.compile(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", re.IGNORECASE)
+
+# as in the WHATWG encoding standard, browsers read these labels as windows-1252
+_ALIASES = {"iso-8859-1": "cp1252", "latin-1": "cp1252", "latin1": "cp1252", "ascii": "cp1252", "us-ascii": "cp1252"}
+
+
+class HTMLBytes(bytes):
+    """Undecoded html body that keeps the Content-Type header it was served with, for the charset it may give"""
+    def __new__(cls, body: bytes, content_type: str = ""):
+        html = super(HTMLBytes, cls).__new__(cls, body)
+        html.content_type = content_type
+        return html
+
+
+def _codec(label: str) -> Optional[str]:
+    """Python codec for an encoding label, None if unknown"""
+    label = label.strip().lower()
+    label = _ALIASES.get(label, label)
+    try:
+        return codecs.lookup(label).name
+    except LookupError:
+        return None
+
+
+def sniff_encoding(body: bytes, content_type: str = "", sniff_bytes: int = 4096, detect_bytes: int = 65536) -> str:
+    """
+    Encoding of an html body, looking only at its start
+    In order: byte order mark, charset in the Content-Type header, <meta charset> in the first sniff_bytes,
+    valid utf-8, and finally statistical detection on the first detect_bytes.
+    Without content_type the header kept by HTMLBytes is used.
+    """
+    content_type = content_type or getattr(body, "content_type", "")
+    for bom, encoding in _BOMS:
+        if body.startswith(bom):
+            return encoding
+
+    match = _CHARSET_HEADER.search(content_type or "")
+    if match and _codec(match.group(1)):
+        return _codec(match.group(1))
+
+    prefix = body[:sniff_bytes]
+    match = _CHARSET_META.search(prefix)
+    if match and _codec(match.group(1).decode("ascii", errors="ignore")):
+        return _codec(match.group(1).decode("ascii", errors="ignore"))
+
+    prefix = body[:detect_bytes]
+    try:
+        prefix.decode("utf-8")
+        return "utf-8"
+    except UnicodeDecodeError as e:
+        if e.start >= len(prefix) - 3 and len(body) > len(prefix):
+            return "utf-8"  # only a character cut off at the end of the prefix
+
+    try:
+        from charset_normalizer import from_bytes  # lazy import
+        best = from_bytes(prefix).best()
+        if best is not None and _codec(best.encoding):
+            logging.debug(f"Encoding detected from first {len(prefix)} bytes: {best.encoding}")
+            return _codec(best.encoding)
+    except ImportError:
+        pass
+    return "cp1252"
+
+
+def decode_html(body: bytes, content_type: str = "") -> str:
+    """Decode an html body with its sniffed encoding, undecodable bytes are replaced"""
+    return body.decode(sniff_encoding(body=body, content_type=content_type), errors="replace")
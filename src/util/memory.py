@@ -0,0 +1,162 @@
+from typing import Dict, List, Optional
+import ctypes
+import ctypes.util
+import gc
+import logging
+import os
+import sys
+import threading
+import tracemalloc
+
+
+def current_rss() -> Optional[int]:
+    """Resident set size of this process in bytes, None where /proc is not available"""
+    try:
+        with open("/proc/self/statm", 'r') as file_in:
+            return int(file_in.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def peak_rss() -> Optional[int]:
+    """Highest resident set size of this process so far in bytes"""
+    try:
+        import resource  # lazy import, not on Windows
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == "darwin" else maxrss * 1024  # kilobytes on Linux
+
+
+def sizeof_values(store: Dict) -> int:
+    """Approximate size in bytes of a dictionary and its values, e.g. html by url, not counting shared keys"""
+    return sys.getsizeof(store) + sum(sys.getsizeof(value) for value in list(store.values()))
+
+
+def release_memory():
+    """Collect garbage and hand freed heap memory back to the operating system where glibc allows it"""
+    gc.collect()
+    libc = ctypes.util.find_library("c")
+    if libc and sys.platform.startswith("linux"):
+        try:
+            ctypes.CDLL(libc).malloc_trim(0)
+        except (OSError, AttributeError):
+            pass
+
+
+class MemoryMonitor(object):
+    """
+    Samples the RSS of the process in a background thread
+    Keeps the peak RSS between begin(key) and end(key), so that overlapping sites in the pipeline each get
+    the peak of their own lifetime. Optionally tracemalloc attributes growth to source lines between snapshots.
+    """
+    def __init__(self, soft_limit: int = 0, sample_interval: float = 1., tracemalloc_top: int = 0):
+        """
+        :param soft_limit: RSS in bytes above which over_limit() is True, 0 for no limit
+        :param sample_interval: Seconds between RSS samples
+        :param tracemalloc_top: Number of source lines reported by snapshot_diff(), 0 to not trace allocations
+        """
+        logging.info(f"Initializing MemoryMonitor with soft limit of {soft_limit // 2 ** 20} MB" if soft_limit else "Initializing MemoryMonitor without memory limit")
+        self.soft_limit = soft_limit
+        self.sample_interval = sample_interval
+        self.tracemalloc_top = tracemalloc_top
+
+        self._lock = threading.Lock()
+        self._peaks = dict()  # {key: peak rss since begin(key)}
+        self._exceeded = set()  # keys that counted towards limit_exceeded since begin(key)
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        self.stats = {"peak_rss": 0, "limit_exceeded": 0}
+
+    def start(self):
+        if self.tracemalloc_top and not tracemalloc.is_tracing():
+            tracemalloc.start(1)
+            self._snapshot = tracemalloc.take_snapshot()
+            logging.info("Tracing memory allocations, this slows down the scrape")
+        if current_rss() is None:
+            logging.info("RSS can not be sampled on this platform, only the peak of the process is reported")
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._sample, name="memory-monitor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.tracemalloc_top and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._snapshot = None
+
+    def _sample(self):
+        while not self._stop.wait(self.sample_interval):
+            self._update(current_rss())
+
+    def _update(self, rss: Optional[int]):
+        if rss is None:
+            return
+        with self._lock:
+            self.stats["peak_rss"] = max(self.stats["peak_rss"], rss)
+            for key, peak in self._peaks.items():
+                if rss > peak:
+                    self._peaks[key] = rss
+
+    def begin(self, key: str):
+        with self._lock:
+            self._peaks[key] = current_rss() or 0
+            self._exceeded.discard(key)
+
+    def end(self, key: str) -> Optional[int]:
+        """Peak RSS since begin(key), falls back to the peak of the process"""
+        self._update(current_rss())
+        with self._lock:
+            peak = self._peaks.pop(key, 0)
+        return peak or peak_rss()
+
+    def over_limit(self, key: Optional[str] = None) -> bool:
+        """True if the RSS is above the soft limit, counted once per key however often it is checked"""
+        if not self.soft_limit:
+            return False
+        rss = current_rss()
+        if rss is not None and rss > self.soft_limit:
+            with self._lock:
+                if key is None or key not in self._exceeded:
+                    self.stats["limit_exceeded"] += 1
+                if key is not None:
+                    self._exceeded.add(key)
+            return True
+        return False
+
+    def snapshot_diff(self) -> List[str]:
+        """Source lines with the largest growth in allocated memory since the previous call"""
+        if not self.tracemalloc_top or not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>")))
+        differences = snapshot.compare_to(self._snapshot, "lineno")[:self.tracemalloc_top]
+        self._snapshot = snapshot
+        return [f"{diff.traceback[0].filename}:{diff.traceback[0].lineno} {diff.size_diff // 1024:+d} KB" for diff in differences]
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, rss=current_rss(), peak_rss_process=peak_rss())
+
+
+if __name__ == "__main__":
+
+    import time
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    monitor = MemoryMonitor(soft_limit=2 ** 30, sample_interval=0.1, tracemalloc_top=3)
+    monitor.start()
+    monitor.begin("example")
+    blocks = [b"x" * 2 ** 20 for _ in range(50)]
+    time.sleep(0.3)
+    print(monitor.snapshot_diff())
+    del blocks
+    release_memory()
+    print(f"Peak RSS {monitor.end('example') // 2 ** 20} MB, now {current_rss() // 2 ** 20} MB, over limit: {monitor.over_limit()}")
+    monitor.stop()
@@ -0,0 +1,170 @@
+from collections import Counter, defaultdict
+from typing import Callable, Dict, List
+import logging
+import os
+import re
+import sys
+import threading
+import zlib
+
+
+class SamplingProfiler(object):
+    """
+    Low overhead wall-clock profiler for long runs
+    A background thread samples the stacks of all threads every interval. Samples of a thread are attributed
+    to the base-url it is working on (see attribute()), samples of idle threads are not kept. Because time is
+    sampled and not traced, sleeps and waits for the network show up next to parsing and saving.
+    Stacks are kept in the folded format of flamegraph.pl and speedscope, one file per base-url.
+    With sample_share below 1 only a stable subset of the base-urls is profiled.
+    """
+    def __init__(self, dir_out: str, interval: float = 0.01, sample_share: float = 1., top: int = 30):
+        """
+        :param dir_out: Folder for the .folded file per base-url and the summary of the run
+        :param interval: Seconds between samples
+        :param sample_share: Share of the base-urls that is profiled, chosen by a hash of the base-url
+        :param top: Number of functions in the summary
+        """
+        logging.info(f"Initializing SamplingProfiler every {interval * 1000:.0f} ms for {sample_share:.0%} of the base-urls, writing to {dir_out}")
+        self.dir_out = dir_out
+        self.interval = interval
+        self.sample_share = sample_share
+        self.top = top
+
+        self._lock = threading.Lock()
+        self._keys = dict()  # {thread id: base-url the thread is working on}
+        self._stacks = defaultdict(Counter)  # {base-url: {folded stack: samples}}, until the base-url is flushed
+        self._self = Counter()  # {function: samples on top of the stack}
+        self._inclusive = Counter()  # {function: samples anywhere in the stack}
+        self._files = dict()  # {base-url: file name}
+        self._labels = dict()  # {code object: function label}, labels are made once
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"samples": 0, "idle_samples": 0}
+
+    def sampled(self, key: str) -> bool:
+        """True if the base-url is in the profiled subset, the same base-urls in every run"""
+        return self.sample_share >= 1 or zlib.crc32(key.encode("utf-8")) % 10000 < self.sample_share * 10000
+
+    def attribute(self, function: Callable, key: Callable[..., str]) -> Callable:
+        """Wrap a pipeline stage, so that samples of the thread running it count for the base-url of its item"""
+        def wrapped(item):
+            item_key = key(item)
+            if not self.sampled(item_key):
+                return function(item)
+            thread_id = threading.get_ident()
+            with self._lock:
+                self._keys[thread_id] = item_key
+            try:
+                return function(item)
+            finally:
+                with self._lock:
+                    self._keys.pop(thread_id, None)
+        return wrapped
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        frames = sys._current_frames()
+        with self._lock:
+            keys = dict(self._keys)
+        self.stats["samples"] += 1
+        for thread_id, frame in frames.items():
+            key = keys.get(thread_id)
+            if key is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)))
+            stack.reverse()
+            with self._lock:
+                self._stacks[key][";".join(stack)] += 1
+            self._self[stack[-1]] += 1
+            self._inclusive.update(set(stack[1:]))
+        if not keys:
+            self.stats["idle_samples"] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        os.makedirs(self.dir_out, exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def flush(self, key: str):
+        """Append the stacks sampled for a base-url to its .folded file, call when the base-url is done"""
+        with self._lock:
+            stacks = self._stacks.pop(key, None)
+        if not stacks:
+            return
+        file_name = self._files.get(key)
+        if file_name is None:
+            file_name = f"{len(self._files):06d}_{re.sub(r'[^A-Za-z0-9.-]+', '_', key)[:100]}.folded"
+            self._files[key] = file_name
+        with open(f"{self.dir_out}/{file_name}", 'a', encoding='utf-8') as file_out:
+            file_out.write("".join(f"{stack} {samples}\n" for stack, samples in stacks.items()))
+
+    def stop(self):
+        """Stop sampling, write what is left and the summary of the run"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for key in list(self._stacks):
+            self.flush(key)
+        summary = self.summary()
+        with open(f"{self.dir_out}/_summary.txt", 'w', encoding='utf-8') as file_out:
+            file_out.write("\n".join(summary) + "\n")
+        for line in summary:
+            logging.info(line)
+
+    def summary(self) -> List[str]:
+        """
+        Functions with the most samples, ranked once by samples on top of the stack (self) and once by samples
+        anywhere in it (total), the second ranking shows the stages and callers that the time goes through
+        """
+        total = sum(self._self.values()) or 1
+        lines = [f"Profile of {len(self._files)} base-urls, {sum(self._self.values())} samples every {self.interval * 1000:.0f} ms"]
+        for name, ranking in [("self", self._self), ("total", self._inclusive)]:
+            lines.append(f"{'self':>7} {'total':>7}  function, by {name}")
+            for function, _ in ranking.most_common(self.top):
+                lines.append(f"{self._self[function] / total:7.1%} {self._inclusive[function] / total:7.1%}  {function}")
+        return lines
+
+    def get_stats(self) -> Dict:
+        return dict(self.stats, profiled_base_urls=len(self._files))
+
+
+if __name__ == "__main__":
+
+    import tempfile
+    import time
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    def busy(item):
+        end = time.time() + 0.2
+        while time.time() < end:
+            sum(i * i for i in range(1000))
+        time.sleep(0.1)
+        return item
+
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        profiler = SamplingProfiler(dir_out=dir_tmp, interval=0.005, top=5)
+        profiler.start()
+        stage = profiler.attribute(busy, key=lambda item: item)
+        for base_url in ["https://www.cbs.nl", "https://www.example.nl"]:
+            stage(base_url)
+            profiler.flush(base_url)
+        profiler.stop()
+        print(sorted(os.listdir(dir_tmp)))
@@ -0,0 +1,229 @@
+from array import array
+from typing import Iterator, Optional, TextIO
+from urllib.parse import urlsplit
+import bz2
+import csv
+import gzip
+import io
+import ipaddress
+import logging
+import lzma
+import mmap
+import os
+import re
+
+
+_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+_INDEX_MAGIC = 0x5746534958444931  # marks a line index, followed by size and mtime of the indexed file
+_HOST = re.compile(r"^[a-z0-9]([a-z0-9_-]*[a-z0-9])?(\.[a-z0-9]([a-z0-9_-]*[a-z0-9])?)*\.?$")
+
+
+def open_text(path: str) -> TextIO:
+    """Open a text file for reading, decompressing .gz, .bz2 and .xz files on the fly"""
+    opener = _OPENERS.get(os.path.splitext(path)[1].lower())
+    if opener is None:
+        return open(path, 'r', encoding='utf-8-sig', newline='')
+    return io.TextIOWrapper(opener(path, 'rb'), encoding='utf-8-sig', newline='')
+
+
+def _valid_host(host: str) -> bool:
+    """Host name, e.g. localhost or www.cbs.nl, or an IPv4 or IPv6 address"""
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return bool(_HOST.match(host))
+
+
+def normalise_url(value: str) -> Optional[str]:
+    """Base-url with lowercase scheme and host, None if it is not a usable url. User info and port are kept"""
+    value = value.strip()
+    if not value or value.startswith("#") or any(char.isspace() for char in value):
+        return None
+    has_scheme = value.lower().startswith(("http://", "https://"))
+    try:
+        parts = urlsplit(value if has_scheme else f"//{value}")
+    except ValueError:
+        return None
+    try:
+        hostname = parts.hostname or ""
+        parts.port  # out of range ports raise here
+    except ValueError:
+        return None
+    try:
+        ascii_host = hostname if hostname.isascii() else hostname.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+    if not _valid_host(ascii_host):
+        return None
+    userinfo, _, hostport = parts.netloc.rpartition("@")
+    netloc = f"{userinfo}@{hostport.lower()}" if userinfo else hostport.lower()
+    scheme = f"{parts.scheme.lower()}://" if has_scheme else ""
+    return f"{scheme}{netloc}{parts.path}{'?' + parts.query if parts.query else ''}"
+
+
+class InputSource(object):
+    """
+    Streams values from a text, csv or parquet file, one per line or row
+    Plain text files get a sidecar line index ({path}.idx, memory-mapped), so that a shard seeks straight
+    to its offset instead of reading all lines before it. The index is rebuilt when the file changes.
+    Compressed text and csv files are decompressed on the fly and skipped up to the offset, parquet
+    files skip whole row groups.
+    """
+    def __init__(self, path: str, column: str = "url", index: bool = True):
+        """
+        :param path: File with one value per line, or csv or parquet file (optionally compressed) with a column of values
+        :param column: Column with the values in csv and parquet files
+        :param index: False to never write or read a line index
+        """
+        self.path = path
+        self.column = column
+        self.index = index
+        name = path.lower()
+        name = os.path.splitext(name)[0] if os.path.splitext(name)[1] in _OPENERS else name
+        self.format = "parquet" if name.endswith(".parquet") else "csv" if name.endswith(".csv") else "text"
+        self.compressed = os.path.splitext(path)[1].lower() in _OPENERS
+
+    def read(self, offset: int = 0, limit: Optional[int] = None) -> Iterator[str]:
+        """Values from line (or row) offset on, at most limit lines, empty lines count but are not returned"""
+        if self.format == "parquet":
+            lines = self._read_parquet(offset=offset)
+        elif self.format == "csv":
+            lines = self._skip(self._read_csv(), offset=offset)
+        else:
+            lines = self._read_text(offset=offset)
+
+        for count, line in enumerate(lines):
+            if limit is not None and count >= limit:
+                return
+            line = line.rstrip()
+            if line:
+                yield line
+
+    @staticmethod
+    def _skip(lines: Iterator[str], offset: int) -> Iterator[str]:
+        for count, line in enumerate(lines):
+            if count >= offset:
+                yield line
+
+    def _read_text(self, offset: int) -> Iterator[str]:
+        start = self._offset_of(offset) if offset and self.index and not self.compressed else None
+        if start is None:
+            with open_text(self.path) as file_in:
+                yield from self._skip(file_in, offset=offset)
+            return
+        with open(self.path, 'rb') as file_in:
+            file_in.seek(start)
+            for line in file_in:
+                yield line.decode('utf-8')
+
+    def _read_csv(self) -> Iterator[str]:
+        with open_text(self.path) as file_in:
+            reader = csv.DictReader(file_in)
+            if self.column not in (reader.fieldnames or []):
+                raise ValueError(f"Column {self.column} not found in {self.path}, columns are: {reader.fieldnames}")
+            for row in reader:
+                yield row[self.column] or ""
+
+    def _read_parquet(self, offset: int) -> Iterator[str]:
+        import pyarrow.parquet as pq  # lazy import
+
+        parquet = pq.ParquetFile(self.path)
+        rows_before = 0
+        for row_group in range(parquet.num_row_groups):
+            rows = parquet.metadata.row_group(row_group).num_rows
+            if rows_before + rows <= offset:
+                rows_before += rows  # whole row group is before the offset, it is not read at all
+                continue
+            values = parquet.read_row_group(row_group, columns=[self.column]).column(self.column).to_pylist()
+            for value in values[max(offset - rows_before, 0):]:
+                yield value or ""
+            rows_before += rows
+
+    def _offset_of(self, line: int) -> Optional[int]:
+        """Byte offset of a line in a plain text file from its index, None if there is no usable index"""
+        path_index = f"{self.path}.idx"
+        stat = os.stat(self.path)
+        if not self._index_valid(path_index, stat):
+            try:
+                self._build_index(path_index)
+            except OSError as e:
+                logging.info(f"Could not write line index {path_index}, reading from the start. Error: {e}")
+                return None
+        with open(path_index, 'rb') as file_index:
+            with mmap.mmap(file_index.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                offsets = memoryview(mapped).cast('Q')
+                try:
+                    lines = len(offsets) - 3
+                    return offsets[3 + line] if line < lines else stat.st_size
+                finally:
+                    offsets.release()
+
+    def _index_valid(self, path_index: str, stat: os.stat_result) -> bool:
+        if not os.path.exists(path_index):
+            return False
+        with open(path_index, 'rb') as file_index:
+            header = array('Q')
+            try:
+                header.fromfile(file_index, 3)
+            except EOFError:
+                return False
+        return list(header) == [_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns]
+
+    def _build_index(self, path_index: str):
+        """Write the byte offset of every line start, after a header with the size and mtime of the file"""
+        stat = os.stat(self.path)
+        offsets = array('Q', [_INDEX_MAGIC, stat.st_size, stat.st_mtime_ns])
+        position = 0
+        with open(self.path, 'rb') as file_in:
+            if file_in.read(3) != b"\xef\xbb\xbf":
+                file_in.seek(0)
+            else:
+                position = 3
+            offsets.append(position)
+            while True:
+                chunk = file_in.read(1024 * 1024)
+                if not chunk:
+                    break
+                start = chunk.find(b"\n")
+                while start != -1:
+                    offsets.append(position + start + 1)
+                    start = chunk.find(b"\n", start + 1)
+                position += len(chunk)
+        if offsets[-1] == position:
+            offsets.pop()  # no line after the last newline
+
+        path_tmp = f"{path_index}.{os.getpid()}.tmp"
+        with open(path_tmp, 'wb') as file_out:
+            offsets.tofile(file_out)
+        os.replace(path_tmp, path_index)
+        logging.info(f"Wrote line index of {len(offsets) - 3} lines to {path_index}")
+
+
+def read_urls(path: str, offset: int = 0, limit: Optional[int] = None, column: str = "url", index: bool = True) -> Iterator[str]:
+    """Normalised base-urls from a file, lines that are not a usable url are skipped and logged"""
+    skipped = 0
+    for value in InputSource(path=path, column=column, index=index).read(offset=offset, limit=limit):
+        url = normalise_url(value)
+        if url is None:
+            if not value.lstrip().startswith("#"):
+                skipped += 1
+                logging.debug(f"Skipped input line that is not a usable url: {value}")
+            continue
+        yield url
+    if skipped:
+        logging.info(f"Skipped {skipped} input lines that are not a usable url")
+
+
+if __name__ == "__main__":
+
+    import tempfile
+
+    logging.basicConfig(level=logging.DEBUG)
+
+    with tempfile.TemporaryDirectory() as dir_tmp:
+        path = f"{dir_tmp}/urls.txt"
+        with open(path, 'w', encoding='utf-8') as file_out:
+            file_out.write("".join(f"https://www.Example{i}.nl/\n" for i in range(10)) + "not a url\n# comment\ncbs.nl\n")
+        print(list(read_urls(path, offset=8, limit=10)))
+        print(list(read_urls(path, offset=3, limit=2)))